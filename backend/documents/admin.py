@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document
+from .models import AnalysisJob, Document
 
 # Register your models here.
 
@@ -9,4 +9,11 @@ class DocumentAdmin(admin.ModelAdmin):
     search_fields = ('user','content_hash')
     list_filter = ('created_at',)
     ordering = ('-created_at',)
-    date_hierarchy = 'created_at'
\ No newline at end of file
+    date_hierarchy = 'created_at'
+
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    ordering = ('-created_at',)
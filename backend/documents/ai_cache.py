@@ -0,0 +1,60 @@
+# documents/ai_cache.py
+import hashlib
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import AIChunkResult
+from .texts import QUERY_BATCH
+
+
+def chunk_hash(chunk):
+    """Hash of a chunk with whitespace collapsed, so re-extraction noise still hits."""
+    return hashlib.sha256(' '.join(chunk.split()).encode('utf-8')).hexdigest()
+
+
+def cached_predictions(model, chunks, predict):
+    """
+    Predictions ({'label', 'score'}) for chunks, in order. Only chunks not
+    cached for this model are passed to predict(list_of_chunks); their
+    results are stored and the cache is trimmed to AI_CACHE_MAX_ENTRIES.
+    """
+    hashes = [chunk_hash(c) for c in chunks]
+    cached = {}
+    unique = list(set(hashes))
+    for i in range(0, len(unique), QUERY_BATCH):
+        rows = AIChunkResult.objects.filter(model=model, chunk_hash__in=unique[i:i + QUERY_BATCH])
+        cached.update((r.chunk_hash, r) for r in rows)
+
+    if cached:
+        hit_ids = [r.pk for r in cached.values()]
+        for i in range(0, len(hit_ids), QUERY_BATCH):
+            AIChunkResult.objects.filter(pk__in=hit_ids[i:i + QUERY_BATCH]).update(last_used=timezone.now())
+
+    preds = {h: {'label': r.label, 'score': r.score} for h, r in cached.items()}
+    missing = {}
+    for h, c in zip(hashes, chunks):
+        if h not in preds:
+            missing.setdefault(h, c)
+    if missing:
+        results = predict(list(missing.values()))
+        preds.update(zip(missing.keys(), results))
+        AIChunkResult.objects.bulk_create(
+            [
+                AIChunkResult(model=model, chunk_hash=h, label=preds[h]['label'], score=preds[h]['score'])
+                for h in missing
+            ],
+            ignore_conflicts=True
+        )
+        evict()
+    return [preds[h] for h in hashes]
+
+
+def evict():
+    """Drop the least recently used entries above AI_CACHE_MAX_ENTRIES."""
+    excess = AIChunkResult.objects.count() - settings.AI_CACHE_MAX_ENTRIES
+    if excess <= 0:
+        return
+    stale = list(AIChunkResult.objects.order_by('last_used').values_list('pk', flat=True)[:excess])
+    for i in range(0, len(stale), QUERY_BATCH):
+        AIChunkResult.objects.filter(pk__in=stale[i:i + QUERY_BATCH]).delete()
@@ -0,0 +1,120 @@
+# documents/alignment.py
+"""
+Exact passage alignment: a suffix automaton is built over each
+normalized candidate source and the upload is streamed through it, which
+gives the longest match ending at every position of the upload (so a
+passage is found wherever it recurs) in time linear in the candidate's
+length plus len(upload).
+"""
+from django.conf import settings
+
+from .texts import iter_document_texts
+from .shingles import alnum_chars
+
+
+class SuffixAutomaton:
+    """Suffix automaton of a string: a state per class of its substrings sharing end positions."""
+
+    def __init__(self, s):
+        self.next = [{}]
+        self.link = [-1]
+        self.length = [0]
+        last = 0
+        for c in s:
+            cur = self._add_state(self.length[last] + 1, -1, {})
+            p = last
+            while p != -1 and c not in self.next[p]:
+                self.next[p][c] = cur
+                p = self.link[p]
+            if p == -1:
+                self.link[cur] = 0
+            else:
+                q = self.next[p][c]
+                if self.length[p] + 1 == self.length[q]:
+                    self.link[cur] = q
+                else:
+                    clone = self._add_state(self.length[p] + 1, self.link[q], dict(self.next[q]))
+                    while p != -1 and self.next[p].get(c) == q:
+                        self.next[p][c] = clone
+                        p = self.link[p]
+                    self.link[q] = self.link[cur] = clone
+            last = cur
+
+    def _add_state(self, length, link, transitions):
+        self.next.append(transitions)
+        self.link.append(link)
+        self.length.append(length)
+        return len(self.length) - 1
+
+    def common_substrings(self, t, min_length):
+        """
+        Merged (start, end) spans of t covered by substrings at least
+        min_length long that occur in the automaton's string, wherever
+        they occur in t.
+        """
+        nxt, link, length = self.next, self.link, self.length
+        spans = []
+        v = l = 0
+        for i, c in enumerate(t):
+            # v, l: the longest suffix of t[:i + 1] found in the string
+            w = nxt[v].get(c)
+            while w is None and v:
+                v = link[v]
+                l = length[v]
+                w = nxt[v].get(c)
+            if w is None:
+                l = 0
+            else:
+                v = w
+                l += 1
+            if l >= min_length:
+                # match starts never move backwards
+                start = i - l + 1
+                if spans and start <= spans[-1][1]:
+                    spans[-1][1] = i + 1
+                else:
+                    spans.append([start, i + 1])
+        return [(start, end) for start, end in spans]
+
+
+def aligned_spans(text, candidate_ids, progress=None):
+    """
+    Exact matched spans of text as (start, end, document_id), with offsets
+    into the original text. Matching ignores case, whitespace and
+    punctuation; spans shorter than ALIGNMENT_MIN_MATCH_LENGTH normalized
+    characters are dropped. progress(done, total, spans), if given, is
+    called after each candidate with that candidate's spans.
+    """
+    norm, offsets = alnum_chars(text)
+    if not norm:
+        return []
+    min_length = settings.ALIGNMENT_MIN_MATCH_LENGTH
+
+    found = []
+    for done, (pk, content) in enumerate(iter_document_texts(candidate_ids, chunk_size=10), 1):
+        source, _ = alnum_chars(content)
+        spans = [(start, end, pk) for start, end in SuffixAutomaton(source).common_substrings(norm, min_length)]
+        found.extend(spans)
+        if progress:
+            progress(done, len(candidate_ids), [(offsets[s], offsets[e - 1] + 1, pk) for s, e, pk in spans])
+
+    # longest first; drop spans already covered by a longer match from another source
+    found.sort(key=lambda s: s[0] - s[1])
+    spans = []
+    for start, end, pk in found:
+        if any(s <= start and end <= e for s, e, _ in spans):
+            continue
+        spans.append((start, end, pk))
+    spans.sort()
+    return [(offsets[start], offsets[end - 1] + 1, pk) for start, end, pk in spans]
+
+
+def merge_spans(spans):
+    """Merge overlapping or touching (start, end) spans."""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
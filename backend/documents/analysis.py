@@ -0,0 +1,567 @@
+# documents/analysis.py
+import hashlib
+import logging
+import os
+import re
+import zipfile
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+
+from .models import CorpusVersion, Document, ExtractedText
+from .normalize import canonical_text
+from .pools import process_pool
+from .revisions import carry_over, changed_regions, join_regions, split_span, unchanged_blocks
+from .utils import (
+    extract_text_from_file,
+    extract_text_from_bytes,
+    analyze_text,
+    analyze_batch,
+    check_ai_probability,
+    check_ai_probability_batch,
+    calculate_document_stats,
+    calculate_position,
+    notify,
+    partial_score
+)
+
+logger = logging.getLogger(__name__)
+
+
+MAX_FILE_SIZE = 10 * 1024 * 1024
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+AI_SCAN_MODES = ('adaptive', 'full')
+
+
+class AnalysisError(ValueError):
+    """The upload cannot be analyzed; the message is safe to show to the user."""
+
+
+def validate_text(text):
+    words = re.findall(r'\w+', text)
+    if len(words) < 10 or len(text) < 200:
+        raise AnalysisError("Document too short for analysis")
+
+
+def scan_mode(ai_scan=None):
+    """The AI scan mode asked for by a request (`ai_scan`), AI_SCAN_MODE if none."""
+    if not ai_scan:
+        return settings.AI_SCAN_MODE
+    if ai_scan not in AI_SCAN_MODES:
+        raise AnalysisError(f"ai_scan must be one of: {', '.join(AI_SCAN_MODES)}")
+    return ai_scan
+
+
+def calculate_content_hash(text):
+    """md5 of the canonical form of text, so re-extractions of a document (PDF vs DOCX, ...) agree."""
+    canonical, _ = canonical_text(text)
+    return hashlib.md5(canonical.encode('utf-8')).hexdigest()
+
+
+def calculate_file_hash(file):
+    """sha256 of the raw upload, read chunk by chunk."""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def cached_extraction(file_hash):
+    """The document whose text was extracted from these exact bytes before, if any."""
+    return Document.objects.filter(extractions__file_hash=file_hash).first()
+
+
+def remember_extraction(file_hash, document):
+    if file_hash:
+        ExtractedText.objects.update_or_create(file_hash=file_hash, defaults={'document': document})
+
+
+def corpus_changes(doc):
+    """
+    (current corpus version, ids of the documents added since doc was last
+    analyzed). The ids are None when doc needs a full analysis: it never
+    was analyzed, or a document was deleted since.
+    """
+    version, last_delete = CorpusVersion.current()
+    if doc is None or doc.analysis_version is None or last_delete > doc.analysis_version:
+        return version, None
+    if version == doc.analysis_version:
+        return version, []
+    added = (
+        Document.objects
+        .filter(version__gt=doc.analysis_version)
+        .exclude(pk=doc.pk)
+        .values_list('pk', flat=True)
+    )
+    return version, list(added)
+
+
+def find_parent(user, name, parent=None):
+    """
+    The user's document an upload named name revises: the one with id
+    parent if given, else (with ANALYSIS_REVISIONS) the latest one uploaded
+    under the same name, if any.
+    """
+    documents = Document.objects.filter(user=user)
+    if parent:
+        doc = documents.filter(pk=parent).first() if str(parent).isdigit() else None
+        if doc is None:
+            raise AnalysisError("Parent document not found")
+        return doc
+    if settings.ANALYSIS_REVISIONS and name:
+        return documents.filter(file_name=name).order_by('-created_at').first()
+    return None
+
+
+def lineage(pk, user):
+    """
+    pk and the ids of the earlier drafts it revises, directly or not,
+    followed through user's own documents only.
+    """
+    ids = []
+    documents = Document.objects.filter(user=user)
+    while pk and pk not in ids:
+        parents = list(documents.filter(pk=pk).values_list('parent_id', flat=True))
+        if not parents:
+            break
+        ids.append(pk)
+        pk = parents[0]
+    return ids
+
+
+def reusable(doc):
+    """Whether doc's stored plagiarism results can be extended (same PLAGIARISM_MODE, offsets on every highlight)."""
+    return doc.analysis_mode == settings.PLAGIARISM_MODE and all('start' in h for h in doc.highlights)
+
+
+def sampled(doc):
+    """Whether doc's AI score comes from an adaptive scan that stopped before the last chunk."""
+    confidence = doc.ai_confidence or {}
+    return confidence.get('sampled', 0) < confidence.get('total', 0)
+
+
+def _closing_connection(func, *args, **kwargs):
+    """Run func in a pool thread and release that thread's DB connection afterwards."""
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connection.close()
+
+
+def detect(content_hash, text, progress=None, exclude_ids=(), ai_scan=None):
+    """
+    Plagiarism and AI detection for text. The two detectors run side by
+    side (ANALYSIS_PARALLEL_DETECTORS) since only the final capping needs
+    both: the AI score is capped so that plagiarism + ai <= 100.
+    Documents in exclude_ids never count as sources; ai_scan is passed
+    on to check_ai_probability.
+    """
+    plagiarism = partial(analyze_text, content_hash, text, progress=progress, exclude_ids=exclude_ids)
+    return _detect(plagiarism, text, progress=progress, ai_scan=ai_scan)
+
+
+def _detect(plagiarism, text, progress=None, ai_scan=None):
+    """detect() with the plagiarism result coming from plagiarism()."""
+    if settings.ANALYSIS_PARALLEL_DETECTORS:
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='detector') as pool:
+            plag_future = pool.submit(_closing_connection, plagiarism)
+            ai_future = pool.submit(_closing_connection, check_ai_probability, text, progress=progress, scan=ai_scan)
+            plag, ai = plag_future.result(), ai_future.result()
+    else:
+        plag = plagiarism()
+        ai = check_ai_probability(text, progress=progress, scan=ai_scan)
+
+    cap = max(0.0, 100.0 - min(plag['score'], 100.0))
+    ai = {**ai, 'raw_score': ai['score'], 'score': min(ai['score'], cap)}
+    return plag, ai
+
+
+def _detect_added(doc, text, added, progress=None, ai_scan=None):
+    """
+    detect() for a document analyzed before, against only the documents
+    added to the corpus since: the new plagiarism matches are merged into
+    the stored ones and the stored AI results are reused (they do not
+    depend on the corpus), unless a full AI scan is asked for and they
+    come from a sample.
+    Returns None when the stored results cannot be extended (another
+    PLAGIARISM_MODE, or analyzed before highlights carried offsets).
+    """
+    stored = doc.highlights
+    if not reusable(doc) or doc.ai_raw_score is None:
+        return None
+
+    new = analyze_text(doc.content_hash, text, progress=progress, candidate_ids=added) if added else {'highlights': []}
+    highlights = [h for h in stored if h['type'] == 'plagiarism'] + new['highlights']
+    plag = {
+        'score': partial_score([(h['start'], h['end']) for h in highlights], len(text)),
+        'highlights': highlights
+    }
+    if scan_mode(ai_scan) == 'full' and sampled(doc):
+        ai = check_ai_probability(text, progress=progress, scan='full')
+    else:
+        ai = {
+            'score': doc.ai_raw_score,
+            'highlights': [h for h in stored if h['type'] == 'ai'],
+            'confidence': doc.ai_confidence
+        }
+    cap = max(0.0, 100.0 - min(plag['score'], 100.0))
+    ai = {**ai, 'raw_score': ai['score'], 'score': min(ai['score'], cap)}
+    return plag, ai
+
+
+def redetect(user, doc, content_hash, text, added, progress=None, ai_scan=None):
+    """
+    detect() for text uploaded by user, only against the added documents
+    when doc (its previous analysis, if any) allows it; added comes from
+    corpus_changes. The earlier drafts of user's that doc revises never
+    count as sources.
+    """
+    drafts = lineage(doc.parent_id, user) if doc else []
+    if doc and added is not None:
+        added = [pk for pk in added if pk not in drafts]
+        if len(added) <= settings.PLAGIARISM_MAX_CANDIDATES:
+            result = _detect_added(doc, text, added, progress=progress, ai_scan=ai_scan)
+            if result:
+                return result
+    return detect(content_hash, text, progress=progress, exclude_ids=drafts, ai_scan=ai_scan)
+
+
+def detect_revision(parent, content_hash, text, progress=None, ai_scan=None):
+    """
+    detect() for a revised draft of parent, in time proportional to the
+    edit: parent's plagiarism matches in the lines carried over unchanged
+    are kept at their new offsets and only the changed regions (with some
+    context, in one pass) are analyzed, plus the whole text against the documents added
+    to the corpus since parent's analysis. AI windows are content-defined
+    and their predictions cached, so only the ones touching an edit reach
+    the model. Parent and its own earlier drafts never count as sources.
+    Returns None when more than ANALYSIS_REVISION_MAX_CHANGE of the text
+    changed.
+    """
+    old = parent.content
+    blocks = unchanged_blocks(old, text)
+    regions = changed_regions(blocks, len(old), len(text))
+    changed = sum(end - start for start, end in regions)
+    if changed > len(text) * settings.ANALYSIS_REVISION_MAX_CHANGE:
+        return None
+    notify(progress, 'revision', parent=parent.pk, characters=changed)
+
+    drafts = lineage(parent.pk, parent.user_id)
+    _, added = corpus_changes(parent)
+    if not reusable(parent) or added is None or len(added) > settings.PLAGIARISM_MAX_CANDIDATES:
+        return detect(content_hash, text, progress=progress, exclude_ids=drafts, ai_scan=ai_scan)
+    added = [pk for pk in added if pk not in drafts]
+
+    def plagiarism():
+        stored = [h for h in parent.highlights if h['type'] == 'plagiarism']
+        highlights = carry_over(stored, blocks, text, regions)
+        if regions:
+            found = analyze_text(content_hash, join_regions(text, regions), exclude_ids=drafts)
+            highlights.extend(
+                {**h, 'position': calculate_position(text, start, end), 'start': start, 'end': end}
+                for h in found['highlights']
+                for start, end in split_span(regions, h['start'], h['end'])
+            )
+        if added:
+            highlights.extend(analyze_text(content_hash, text, candidate_ids=added)['highlights'])
+        highlights.sort(key=lambda h: h['start'])
+        result = {
+            'score': partial_score([(h['start'], h['end']) for h in highlights], len(text)),
+            'highlights': highlights
+        }
+        notify(progress, 'plagiarism', done=1, total=1, **result)
+        return result
+
+    return _detect(plagiarism, text, progress=progress, ai_scan=ai_scan)
+
+
+def run_analysis(user, file, progress=None, parent=None, ai_scan=None, name=None):
+    """
+    Extract, score and persist one uploaded file for user and return the
+    payload served by AnalyzeDocumentView (and stored on AnalysisJob).
+    progress(event, data), if given, is told when each stage finishes.
+    An upload revising one of the user's documents (see find_parent; parent
+    is an explicit document id) only has its changes analyzed. ai_scan
+    picks the AI scan mode (see scan_mode). name is the upload's own file
+    name, when file was stored under another.
+    """
+    ai_scan = scan_mode(ai_scan)
+    name = os.path.basename(name or file.name)
+    draft = find_parent(user, name, parent)
+
+    # 1. extract (or reuse the text of a byte-identical upload) & basic validation
+    file_hash = calculate_file_hash(file)
+    cached = cached_extraction(file_hash)
+    if cached:
+        text = cached.content
+        content_hash = cached.content_hash
+    else:
+        text = extract_text_from_file(file).strip()
+        content_hash = calculate_content_hash(text)
+    logger.info(f"[{user}] extracted {len(text)} chars{' (cached)' if cached else ''}")
+    notify(progress, 'extraction', characters=len(text), cached=bool(cached))
+
+    validate_text(text)
+
+    # 2. a document analyzed before only needs comparing against what the
+    # corpus gained since (nothing, if its version is unchanged)
+    existing = cached or Document.objects.filter(content_hash=content_hash).first()
+    if existing:
+        # the same canonical text, maybe extracted differently (PDF vs
+        # DOCX): its stored results and highlights refer to the stored text
+        text = existing.content
+    version, added = corpus_changes(existing)
+    if added == [] and not (ai_scan == 'full' and sampled(existing)):
+        remember_extraction(file_hash, existing)
+        if version != existing.analysis_version:
+            # only its own insert since; skip the lookup next time
+            Document.objects.filter(pk=existing.pk).update(analysis_version=version)
+        return analysis_payload(existing)
+
+    # 3. plagiarism & AI, for a revised draft only where it changed
+    result = None
+    if draft and not existing:
+        result = detect_revision(draft, content_hash, text, progress=progress, ai_scan=ai_scan)
+        if result is None and parent:
+            # an explicit revision, only too different to reuse the results
+            result = detect(content_hash, text, progress=progress, exclude_ids=lineage(draft.pk, user), ai_scan=ai_scan)
+        if result is None:
+            draft = None
+    plag, ai = result or redetect(user, existing, content_hash, text, added, progress=progress, ai_scan=ai_scan)
+
+    # 4. persist
+    return save_analysis(
+        user, file, text, content_hash, plag, ai,
+        file_hash=file_hash, version=version, file_name=name, parent=draft
+    )
+
+
+def read_uploads(files):
+    """
+    (name, bytes) for every uploaded file of a batch, with .zip archives
+    expanded into the supported documents they contain.
+    """
+    items = []
+    for file in files:
+        if file.name.lower().endswith('.zip'):
+            items.extend(read_archive(file))
+        elif file.size > MAX_FILE_SIZE:
+            raise AnalysisError(f"{file.name} is too large (max 10MB)")
+        else:
+            items.append((file.name, file.read()))
+        if len(items) > settings.BATCH_MAX_FILES:
+            raise AnalysisError(f"Too many documents (max {settings.BATCH_MAX_FILES})")
+    return items
+
+
+def read_archive(file):
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile:
+        raise AnalysisError(f"{file.name} is not a valid zip archive")
+
+    items = []
+    with archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or name.startswith('.') or not name.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            # the declared size, so a zip bomb is refused before inflating it
+            if info.file_size > MAX_FILE_SIZE:
+                raise AnalysisError(f"{name} is too large (max 10MB)")
+            items.append((name, archive.read(info)))
+            if len(items) > settings.BATCH_MAX_FILES:
+                raise AnalysisError(f"Too many documents (max {settings.BATCH_MAX_FILES})")
+    return items
+
+
+def _extract(name, data):
+    """(text, None) or (None, error message) for one upload; runs in a worker process."""
+    try:
+        # already in a worker process, so no nested PDF page pool
+        text = extract_text_from_bytes(name, data, parallel=False).strip()
+        validate_text(text)
+        return text, None
+    except ValueError as e:
+        return None, str(e)
+
+
+def extract_texts(items):
+    """_extract for every (name, bytes), spread over BATCH_EXTRACTION_WORKERS processes."""
+    workers = min(settings.BATCH_EXTRACTION_WORKERS, len(items))
+    if workers <= 1:
+        return [_extract(name, data) for name, data in items]
+    pool = process_pool('batch', settings.BATCH_EXTRACTION_WORKERS)
+    return list(pool.map(_extract, *zip(*items)))
+
+
+def detect_batch(texts, hashes, ai_scan=None, exclude_ids=None):
+    """
+    detect() for several texts, with one AI pass over all of them and their
+    pairwise similarity. exclude_ids, if given, has the ids to leave out
+    per text.
+    """
+    if settings.ANALYSIS_PARALLEL_DETECTORS:
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='detector') as pool:
+            plag_future = pool.submit(_closing_connection, analyze_batch, texts, hashes, exclude_ids)
+            ai_future = pool.submit(_closing_connection, check_ai_probability_batch, texts, scan=ai_scan)
+            (plags, similarity), ais = plag_future.result(), ai_future.result()
+    else:
+        plags, similarity = analyze_batch(texts, hashes, exclude_ids)
+        ais = check_ai_probability_batch(texts, scan=ai_scan)
+    return plags, ais, similarity
+
+
+def run_batch_analysis(user, items, ai_scan=None):
+    """
+    Extract, score and persist a batch of (name, bytes) uploads for user.
+    Every document is checked against the corpus and the rest of the batch;
+    one revising an earlier upload of the same name (see find_parent) is
+    linked to it and never matched against its drafts. The response has one entry per upload (the run_analysis payload plus
+    its name, or its name and an error) and the pairwise similarity matrix
+    of the analyzed documents.
+    """
+    ai_scan = scan_mode(ai_scan)
+    # byte-identical uploads reuse their stored text
+    file_hashes = [hashlib.sha256(data).hexdigest() for _, data in items]
+    cached = [cached_extraction(file_hash) for file_hash in file_hashes]
+    missing = [i for i, doc in enumerate(cached) if doc is None]
+    extracted = [(doc.content, None) if doc else None for doc in cached]
+    for i, result in zip(missing, extract_texts([items[i] for i in missing])):
+        extracted[i] = result
+    logger.info(f"[{user}] extracted {len(missing)} of {len(items)} documents")
+
+    results = [
+        {'name': name, 'error': error}
+        for (name, _), (_, error) in zip(items, extracted)
+    ]
+    analyzed = [i for i, (text, _) in enumerate(extracted) if text is not None]
+    texts = [extracted[i][0] for i in analyzed]
+    hashes = [calculate_content_hash(text) for text in texts]
+    # uploads sharing a content hash (with a stored document or each other)
+    # are analyzed as the text the document is stored with
+    stored = {
+        doc.content_hash: doc.content
+        for doc in Document.objects.filter(content_hash__in=hashes).select_related('stored_text')
+    }
+    texts = [stored.setdefault(content_hash, text) for content_hash, text in zip(hashes, texts)]
+
+    similarity = []
+    if analyzed:
+        # read before detection, like run_analysis: documents added while it
+        # runs are picked up by the next re-upload
+        version, _ = CorpusVersion.current()
+        drafts = [find_parent(user, items[i][0]) for i in analyzed]
+        plags, ais, similarity = detect_batch(
+            texts, hashes, ai_scan=ai_scan,
+            exclude_ids=[lineage(draft.pk, user) if draft else [] for draft in drafts]
+        )
+        for i, text, content_hash, plag, ai, draft in zip(analyzed, texts, hashes, plags, ais, drafts):
+            name, data = items[i]
+            payload = save_analysis(
+                user, ContentFile(data, name=name), text, content_hash, plag, ai,
+                file_hash=file_hashes[i], version=version, file_name=name, parent=draft
+            )
+            results[i] = {'name': name, **payload}
+
+    return {
+        'results': results,
+        'similarity': {
+            'ids': [results[i]['id'] for i in analyzed],
+            'matrix': similarity
+        }
+    }
+
+
+def save_analysis(user, file, text, content_hash, plag, ai, file_hash='', version=None, file_name='', parent=None):
+    """
+    Store the detector results for text (updating the document with the
+    same content hash if there is one; text is then its content) and
+    return the response payload.
+    file_hash is remembered for the extraction cache and version is the
+    corpus version the results were computed against. A new document
+    records its upload's file_name and the parent draft it revises.
+    """
+    existing = Document.objects.filter(content_hash=content_hash).first()
+
+    p_score = min(plag['score'], 100.0)
+    ai_score = min(ai['score'], 100.0 - p_score)
+
+    p_score = round(p_score, 1)
+    ai_score = round(ai_score, 1)
+
+    stats = calculate_document_stats(text)
+    highlights = plag['highlights'] + ai['highlights']
+
+    if existing:
+        existing.plagiarism_score = p_score
+        existing.ai_score = ai_score
+        existing._highlights = highlights
+        existing.word_count = stats['word_count']
+        existing.character_count = stats['character_count']
+        existing.page_count = stats['page_count']
+        existing.reading_time = stats['reading_time']
+        existing.analysis_version = version
+        existing.analysis_mode = settings.PLAGIARISM_MODE
+        existing.ai_raw_score = ai.get('raw_score', ai['score'])
+        existing.ai_confidence = ai.get('confidence')
+        existing.save()
+        doc = existing
+    else:
+        doc = Document.objects.create(
+            user=user,
+            content=text,
+            content_hash=content_hash,
+            plagiarism_score=p_score,
+            ai_score=ai_score,
+            _highlights=highlights,
+            file=file,
+            file_hash=file_hash,
+            file_name=file_name,
+            parent=parent,
+            analysis_version=version,
+            analysis_mode=settings.PLAGIARISM_MODE,
+            ai_raw_score=ai.get('raw_score', ai['score']),
+            ai_confidence=ai.get('confidence'),
+            **stats
+        )
+    remember_extraction(file_hash, doc)
+    return analysis_payload(doc)
+
+
+def analysis_payload(doc):
+    """The response served for an analyzed document."""
+    # original
+    orig = round(max(0.0, 100.0 - (doc.plagiarism_score + doc.ai_score)), 1)
+
+    # interval of the AI score, capped like the score itself
+    confidence = None
+    if doc.ai_confidence:
+        cap = max(0.0, 100.0 - doc.plagiarism_score)
+        confidence = {
+            'low': round(min(doc.ai_confidence['low'], cap), 1),
+            'high': round(min(doc.ai_confidence['high'], cap), 1),
+            'sampledChunks': doc.ai_confidence['sampled'],
+            'totalChunks': doc.ai_confidence['total']
+        }
+
+    # response (exact same shape you had)
+    return {
+        'id': doc.id,
+        'fileUrl': doc.file.url,
+        'plagiarismScore': doc.plagiarism_score,
+        'aiScore': doc.ai_score,
+        'aiConfidence': confidence,
+        'originalScore': orig,
+        'documentStats': {
+            'wordCount': doc.word_count,
+            'characterCount': doc.character_count,
+            'pageCount': doc.page_count,
+            'readingTime': doc.reading_time
+        },
+        'highlights': doc.highlights
+    }
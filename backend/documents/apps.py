@@ -1,7 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class DocumentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'documents'
 
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # serving processes opt in, so other management commands start fast
+        if settings.AI_DETECTOR_WARMUP:
+            from .detectors import warmup
+            warmup()
@@ -0,0 +1,310 @@
+# documents/detectors.py
+"""
+Inference backends for the AI detector. Each detector is called with a
+list of texts and returns one {'label', 'score'} dict per text, like a
+transformers text-classification pipeline, and exposes its tokenizer.
+torch and transformers are only imported when a backend is built, so
+importing this module (and the views) stays cheap.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import urllib.request
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_detectors = {}
+
+
+class TorchDetector:
+    """transformers pipeline on PyTorch (GPU when available)."""
+
+    @staticmethod
+    def cache_name(model_id):
+        return model_id
+
+    def __init__(self, model_id):
+        import torch
+        from transformers import pipeline
+
+        self.name = self.cache_name(model_id)
+        model = model_id
+        if settings.AI_DETECTOR_MMAP:
+            model = load_mmap_model(model_id) or model_id
+        self.pipeline = pipeline(
+            'text-classification',
+            model=model,
+            tokenizer=model_id,
+            truncation=True,
+            max_length=settings.AI_DETECTOR_MAX_LENGTH,
+            device=0 if torch.cuda.is_available() else -1
+        )
+        self.tokenizer = self.pipeline.tokenizer
+
+    def __call__(self, texts, batch_size=1):
+        return self.pipeline(texts, batch_size=batch_size)
+
+
+# safetensors dtype -> torch dtype name
+SAFETENSORS_DTYPES = {
+    'F64': 'float64', 'F32': 'float32', 'F16': 'float16', 'BF16': 'bfloat16',
+    'I64': 'int64', 'I32': 'int32', 'I16': 'int16', 'I8': 'int8', 'U8': 'uint8', 'BOOL': 'bool',
+}
+
+
+def mmap_state_dict(path):
+    """
+    The tensors of a .safetensors file as views of a private memory map of
+    it: pages are read from the page cache on first use and stay shared by
+    every process mapping the file, forked workers included.
+    """
+    import torch
+
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    (header_size,) = struct.unpack('<Q', mapped[:8])
+    header = json.loads(mapped[8:8 + header_size])
+    header.pop('__metadata__', None)
+
+    state = {}
+    for name, info in header.items():
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info['dtype']])
+        start, end = info['data_offsets']
+        count = (end - start) // dtype.itemsize
+        if count:
+            tensor = torch.frombuffer(mapped, dtype=dtype, count=count, offset=8 + header_size + start)
+        else:
+            tensor = torch.empty(0, dtype=dtype)
+        state[name] = tensor.reshape(info['shape'])
+    return state
+
+
+def load_mmap_model(model_id):
+    """
+    model_id's classifier with its weights memory-mapped from
+    model.safetensors instead of copied into process memory, or None when
+    the checkpoint is not a single safetensors file.
+    """
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+    from transformers.utils import cached_file
+
+    path = cached_file(model_id, 'model.safetensors', _raise_exceptions_for_missing_entries=False)
+    if not path:
+        logger.info(f"{model_id} has no model.safetensors; loading it through transformers")
+        return None
+
+    model = AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(model_id))
+    # assign=True swaps the freshly initialized parameters for the mapped tensors
+    result = model.load_state_dict(mmap_state_dict(path), strict=False, assign=True)
+    if result.missing_keys:
+        logger.warning(f"{model_id}: {len(result.missing_keys)} weights missing from {path}; loading normally")
+        return None
+    return model.eval()
+
+
+class OnnxDetector:
+    """ONNX Runtime session over an exported (optionally INT8-quantized) copy of the model."""
+
+    @staticmethod
+    def cache_name(model_id):
+        return f"{model_id}:onnx{'-int8' if settings.AI_ONNX_QUANTIZE else ''}"
+
+    def __init__(self, model_id):
+        import onnxruntime
+        from transformers import AutoConfig, AutoTokenizer
+
+        quantize = settings.AI_ONNX_QUANTIZE
+        self.name = self.cache_name(model_id)
+        export_dir = onnx_export_dir(model_id)
+        path = os.path.join(export_dir, 'model.int8.onnx' if quantize else 'model.onnx')
+        if not os.path.exists(path):
+            export_onnx(model_id, quantize=quantize)
+
+        options = onnxruntime.SessionOptions()
+        if settings.AI_ONNX_THREADS:
+            options.intra_op_num_threads = settings.AI_ONNX_THREADS
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        self.id2label = AutoConfig.from_pretrained(export_dir).id2label
+
+    def __call__(self, texts, batch_size=1):
+        results = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer(
+                texts[i:i + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=settings.AI_DETECTOR_MAX_LENGTH,
+                return_tensors='np'
+            )
+            logits = self.session.run(['logits'], {
+                'input_ids': enc['input_ids'].astype(np.int64),
+                'attention_mask': enc['attention_mask'].astype(np.int64),
+            })[0]
+            probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probs /= probs.sum(axis=1, keepdims=True)
+            for row in probs:
+                best = int(row.argmax())
+                results.append({'label': self.id2label[best], 'score': float(row[best])})
+        return results
+
+
+class RemoteDetector:
+    """
+    Thin client of the shared inference server (run_inference_server).
+    Only the tokenizer is loaded locally. Texts are sent AI_INFERENCE_MAX_BATCH
+    at a time, each request under AI_INFERENCE_SERVER_TIMEOUT; if one fails
+    the rest go to the in-process backend instead, unless
+    AI_INFERENCE_SERVER_FALLBACK is off. Predictions are cached under the
+    name of the model the server reports, not the one configured here.
+    """
+
+    def __init__(self, model_id, url):
+        from transformers import AutoTokenizer
+
+        self.model_id = model_id
+        self.url = url.rstrip('/')
+        self.name = self.server_model()
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+
+    def __call__(self, texts, batch_size=1):
+        step = max(1, settings.AI_INFERENCE_MAX_BATCH)
+        results = []
+        for i in range(0, len(texts), step):
+            try:
+                results.extend(self.predict(texts[i:i + step]))
+            except (OSError, ValueError, KeyError) as e:
+                if not settings.AI_INFERENCE_SERVER_FALLBACK:
+                    raise
+                logger.warning(f"Inference server {self.url} failed ({e}); running detector in-process")
+                return results + get_local_detector()(texts[i:], batch_size=batch_size)
+        return results
+
+    def server_model(self):
+        """The cache name of the server's model (GET /health), or of the in-process one while it is down."""
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=settings.AI_INFERENCE_SERVER_TIMEOUT) as response:
+                return json.loads(response.read())['model']
+        except (OSError, ValueError, KeyError) as e:
+            if not settings.AI_INFERENCE_SERVER_FALLBACK:
+                raise
+            logger.warning(f"Inference server {self.url} is not answering ({e}); using the in-process model's name")
+            return BACKENDS[settings.AI_DETECTOR_BACKEND].cache_name(self.model_id)
+
+    def predict(self, texts):
+        """One /predict request for texts."""
+        body = json.dumps({'texts': texts}).encode('utf-8')
+        request = urllib.request.Request(
+            f"{self.url}/predict",
+            data=body,
+            headers={'Content-Type': 'application/json'}
+        )
+        with urllib.request.urlopen(request, timeout=settings.AI_INFERENCE_SERVER_TIMEOUT) as response:
+            payload = json.loads(response.read())
+        if payload['model'] != self.name:
+            # the server came up after this client, or was restarted on another
+            # model: this call is already cached under the old name, later ones
+            # use the server's
+            expected, self.name = self.name, payload['model']
+            raise ValueError(f"server runs {self.name}, not {expected}")
+        return payload['predictions']
+
+
+BACKENDS = {
+    'torch': TorchDetector,
+    'onnx': OnnxDetector,
+}
+
+
+def get_local_detector():
+    """The process-wide detector for AI_DETECTOR_MODEL on AI_DETECTOR_BACKEND, built once."""
+    key = (settings.AI_DETECTOR_BACKEND, settings.AI_DETECTOR_MODEL)
+    if key not in _detectors:
+        logger.info(f"Loading AI detector {key[1]} ({key[0]} backend)")
+        _detectors[key] = BACKENDS[key[0]](key[1])
+    return _detectors[key]
+
+
+def get_detector():
+    """The shared inference server's client when AI_INFERENCE_SERVER_URL is set, else the local detector."""
+    url = settings.AI_INFERENCE_SERVER_URL
+    if not url:
+        return get_local_detector()
+    key = ('remote', url, settings.AI_DETECTOR_MODEL)
+    if key not in _detectors:
+        _detectors[key] = RemoteDetector(settings.AI_DETECTOR_MODEL, url)
+    return _detectors[key]
+
+
+WARMUP_TEXT = "Warming up the detector before the first request arrives."
+
+
+def warmup(detector=None):
+    """
+    Build the detector (get_detector() by default) and score one text, so
+    the first request pays neither the model load nor the first, slowest
+    inference. A remote detector only loads its tokenizer: the inference
+    server warms itself up.
+    """
+    start = time.monotonic()
+    detector = detector or get_detector()
+    if not isinstance(detector, RemoteDetector):
+        detector([WARMUP_TEXT], batch_size=1)
+    logger.info(f"AI detector {detector.name} ready in {time.monotonic() - start:.1f}s")
+    return detector
+
+
+def onnx_export_dir(model_id):
+    return os.path.join(settings.AI_ONNX_DIR, model_id.replace('/', '--'))
+
+
+def export_onnx(model_id, quantize=True):
+    """
+    Export model_id to ONNX under AI_ONNX_DIR (with its tokenizer and
+    config) and, if quantize, add a dynamically INT8-quantized copy.
+    Returns the path of the model the ONNX backend will load.
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    export_dir = onnx_export_dir(model_id)
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, 'model.onnx')
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModelForSequenceClassification.from_pretrained(model_id)
+    model.eval()
+    tokenizer.save_pretrained(export_dir)
+    model.config.save_pretrained(export_dir)
+
+    sample = tokenizer(['An example sentence.'], return_tensors='pt')
+    logger.info(f"Exporting {model_id} to {path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample['input_ids'], sample['attention_mask']),
+            path,
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['logits'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'logits': {0: 'batch'},
+            },
+            opset_version=17,
+            dynamo=False
+        )
+    if not quantize:
+        return path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized = os.path.join(export_dir, 'model.int8.onnx')
+    quantize_dynamic(path, quantized, weight_type=QuantType.QInt8)
+    return quantized
@@ -0,0 +1,75 @@
+# documents/index.py
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count
+
+from .minhash import index_minhash, lsh_candidates
+from .models import Document, NGramPosting
+from .normalize import canonical_text
+from .shingles import document_grams
+from .texts import QUERY_BATCH
+from .winnowing import index_fingerprints
+
+
+def index_ngrams(document):
+    """(Re)build the n-gram postings of a single document."""
+    NGramPosting.objects.filter(document=document).delete()
+    NGramPosting.objects.bulk_create(
+        (NGramPosting(gram=g, document=document) for g in document_grams(canonical_text(document.content)[0])),
+        batch_size=5000,
+        ignore_conflicts=True
+    )
+
+
+INDEXERS = {
+    'ngram': index_ngrams,
+    'fingerprint': index_fingerprints,
+    'lsh': index_minhash,
+}
+
+
+def active_indexes():
+    """Indexes read by the configured PLAGIARISM_MODE / PLAGIARISM_CANDIDATES."""
+    if settings.PLAGIARISM_MODE == 'winnowing':
+        return ['fingerprint']
+    return [settings.PLAGIARISM_CANDIDATES]
+
+
+def update_indexes(document, names=None):
+    """Refresh the given indexes (default: the active ones) for a document."""
+    for name in names or active_indexes():
+        INDEXERS[name](document)
+
+
+def ngram_candidates(text, exclude_hash=None):
+    """
+    Ids of documents sharing at least PLAGIARISM_MIN_SHARED_NGRAMS hashed
+    5-grams with text, most overlapping first, capped at PLAGIARISM_MAX_CANDIDATES.
+    """
+    grams = list(document_grams(text))
+    shared = Counter()
+    for i in range(0, len(grams), QUERY_BATCH):
+        rows = (
+            NGramPosting.objects
+            .filter(gram__in=grams[i:i + QUERY_BATCH])
+            .values_list('document_id')
+            .annotate(n=Count('id'))
+        )
+        shared.update(dict(rows))
+
+    if exclude_hash:
+        for pk in Document.objects.filter(content_hash=exclude_hash).values_list('pk', flat=True):
+            shared.pop(pk, None)
+
+    return [
+        pk for pk, n in shared.most_common(settings.PLAGIARISM_MAX_CANDIDATES)
+        if n >= settings.PLAGIARISM_MIN_SHARED_NGRAMS
+    ]
+
+
+def find_candidate_documents(text, exclude_hash=None):
+    """Candidate source ids from the pre-filter chosen by PLAGIARISM_CANDIDATES."""
+    if settings.PLAGIARISM_CANDIDATES == 'lsh':
+        return lsh_candidates(text, exclude_hash=exclude_hash)
+    return ngram_candidates(text, exclude_hash=exclude_hash)
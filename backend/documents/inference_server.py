@@ -0,0 +1,137 @@
+# documents/inference_server.py
+"""
+Long-lived local inference server: one process holds the AI detector and
+every Django worker sends it chunks over localhost HTTP. Requests arriving
+within AI_INFERENCE_MAX_WAIT_MS of each other are merged into one batch
+(up to AI_INFERENCE_MAX_BATCH texts) before they reach the model; larger
+requests are split into several batches.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+
+from .detectors import get_local_detector, warmup
+from .utils import batched_predict
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingQueue:
+    """Collects texts from concurrent callers and runs them through the detector together."""
+
+    def __init__(self, detector, max_batch, max_wait):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+        threading.Thread(target=self._run, name='inference-batcher', daemon=True).start()
+
+    def predict(self, texts):
+        # no batch over max_batch texts, so one long document cannot hold
+        # up (or time out) the rest
+        requests = [
+            {'texts': texts[i:i + self.max_batch], 'done': threading.Event()}
+            for i in range(0, len(texts), self.max_batch)
+        ]
+        for request in requests:
+            self.pending.put(request)
+        results = []
+        for request in requests:
+            request['done'].wait()
+            if 'error' in request:
+                raise request['error']
+            results.extend(request['results'])
+        return results
+
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            size = len(batch[0]['texts'])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request['texts'])
+            self._process(batch)
+
+    def _process(self, batch):
+        texts = [t for request in batch for t in request['texts']]
+        try:
+            merged = [
+                {'label': res['label'], 'score': float(res['score'])}
+                for res in batched_predict(self.detector)(texts)
+            ]
+            i = 0
+            for request in batch:
+                request['results'] = merged[i:i + len(request['texts'])]
+                i += len(request['texts'])
+        except Exception as e:
+            logger.exception("Inference batch failed")
+            for request in batch:
+                request['error'] = e
+        finally:
+            for request in batch:
+                request['done'].set()
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    """POST /predict {"texts": [...]} -> {"model": ..., "predictions": [...]}; GET /health."""
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_error(404)
+            return
+        self._send_json(200, {'model': self.server.batcher.detector.name})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            texts = json.loads(self.rfile.read(length))['texts']
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError("texts must be a list of strings")
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        try:
+            predictions = self.server.batcher.predict(texts) if texts else []
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(200, {'model': self.server.batcher.detector.name, 'predictions': predictions})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def make_server(host, port):
+    """HTTP server bound to host:port holding one copy of the local detector."""
+    server = ThreadingHTTPServer((host, port), InferenceHandler)
+    server.daemon_threads = True
+    server.batcher = BatchingQueue(
+        warmup(get_local_detector()),
+        max_batch=max(1, settings.AI_INFERENCE_MAX_BATCH),
+        max_wait=settings.AI_INFERENCE_MAX_WAIT_MS / 1000
+    )
+    return server
@@ -0,0 +1,84 @@
+# documents/jobs.py
+"""
+DB-backed analysis queue: views enqueue AnalysisJob rows and any number of
+`run_analysis_worker` processes claim and run them, so no broker is needed.
+A job is claimed with a conditional UPDATE, which is atomic on every
+database backend.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .analysis import AnalysisError, run_analysis
+from .models import AnalysisJob
+
+logger = logging.getLogger(__name__)
+
+
+def requeue_stale_jobs():
+    """Put back jobs left running longer than ANALYSIS_JOB_STALE_SECONDS (e.g. by a killed worker)."""
+    cutoff = timezone.now() - timedelta(seconds=settings.ANALYSIS_JOB_STALE_SECONDS)
+    return AnalysisJob.objects.filter(status=AnalysisJob.RUNNING, started_at__lt=cutoff).update(
+        status=AnalysisJob.PENDING,
+        started_at=None
+    )
+
+
+def claim_next_job():
+    """Atomically mark the oldest pending job as running and return it, or None."""
+    pending = (
+        AnalysisJob.objects
+        .filter(status=AnalysisJob.PENDING)
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:10]
+    )
+    for pk in pending:
+        claimed = AnalysisJob.objects.filter(pk=pk, status=AnalysisJob.PENDING).update(
+            status=AnalysisJob.RUNNING,
+            started_at=timezone.now()
+        )
+        if claimed:
+            return AnalysisJob.objects.select_related('user').get(pk=pk)
+    return None
+
+
+def process_job(job):
+    """Run one claimed job and store its result or error."""
+    try:
+        job.file.open('rb')
+        try:
+            job.result = run_analysis(
+                job.user, job.file, parent=job.parent_id, ai_scan=job.ai_scan, name=job.original_name
+            )
+        finally:
+            job.file.close()
+        job.status = AnalysisJob.DONE
+    except AnalysisError as e:
+        job.status = AnalysisJob.FAILED
+        job.error = str(e)
+    except Exception:
+        logger.exception(f"Analysis job {job.pk} failed")
+        job.status = AnalysisJob.FAILED
+        job.error = "Internal server error"
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+
+
+def work(poll_interval=None, once=False):
+    """Worker loop: claim and process jobs until interrupted (or the queue is empty, if once)."""
+    poll_interval = poll_interval or settings.ANALYSIS_WORKER_POLL_SECONDS
+    while True:
+        close_old_connections()
+        requeue_stale_jobs()
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        logger.info(f"Processing analysis job {job.pk}")
+        process_job(job)
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.detectors import export_onnx
+
+
+class Command(BaseCommand):
+    help = "Export the AI detector model to ONNX (INT8-quantized unless --no-quantize) for the onnx backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None, help="Model id (defaults to AI_DETECTOR_MODEL).")
+        parser.add_argument('--no-quantize', action='store_true', help="Only write the float32 model.")
+
+    def handle(self, *args, **options):
+        model_id = options['model'] or settings.AI_DETECTOR_MODEL
+        path = export_onnx(model_id, quantize=not options['no_quantize'])
+        self.stdout.write(self.style.SUCCESS(f"Exported {model_id} to {path}"))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from documents.analysis import calculate_content_hash
+from documents.index import INDEXERS, active_indexes, update_indexes
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild plagiarism indexes (n-grams, fingerprints, MinHash/LSH) from every stored document, "
+        "and recompute their content hashes under the current TEXT_* settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--index',
+            action='append',
+            choices=sorted(INDEXERS),
+            help="Index to rebuild (repeatable). Defaults to the ones the current settings use."
+        )
+
+    def handle(self, *args, **options):
+        names = options['index'] or active_indexes()
+        total = 0
+        hashes = {}
+        seen = set()
+        # texts come along in the same query instead of one lookup each
+        documents = Document.objects.select_related('stored_text').order_by('pk')
+        for doc in documents.iterator(chunk_size=100):
+            update_indexes(doc, names)
+            digest = calculate_content_hash(doc.content)
+            # documents normalizing alike keep distinct hashes; the earliest
+            # one is the one found by hash
+            new = digest if digest not in seen else f'{digest}-{doc.pk}'
+            seen.add(digest)
+            if new != doc.content_hash:
+                hashes[doc.pk] = new
+            total += 1
+        with transaction.atomic():
+            # through placeholders, so no row briefly takes a hash another still holds
+            for pk in hashes:
+                Document.objects.filter(pk=pk).update(content_hash=f'rehash-{pk}')
+            for pk, digest in hashes.items():
+                Document.objects.filter(pk=pk).update(content_hash=digest)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {', '.join(names)} index for {total} documents ({len(hashes)} content hashes updated)"
+        ))
@@ -0,0 +1,40 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from documents.detectors import warmup
+from documents.jobs import work
+
+
+class Command(BaseCommand):
+    help = "Process queued AnalysisJob rows; throughput scales with --processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes to fork.")
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        if processes == 1:
+            work(once=options['once'])
+            return
+
+        # load the detector once here so the forked workers share its weights
+        warmup()
+        # children must not share the parent's database connections
+        connections.close_all()
+        ctx = multiprocessing.get_context('fork')
+        workers = [
+            ctx.Process(target=work, kwargs={'once': options['once']}, name=f'analysis-worker-{i}')
+            for i in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(self.style.SUCCESS(f"Started {processes} analysis workers"))
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from documents.inference_server import make_server
+
+
+class Command(BaseCommand):
+    help = "Serve the AI detector to all Django workers over localhost HTTP (see AI_INFERENCE_SERVER_URL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        server = make_server(options['host'], options['port'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Inference server for {server.batcher.detector.name} on {options['host']}:{options['port']}"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from documents.detectors import warmup
+
+
+class Command(BaseCommand):
+    help = "Load the AI detector and run it once (e.g. before a worker starts taking traffic)."
+
+    def handle(self, *args, **options):
+        detector = warmup()
+        self.stdout.write(self.style.SUCCESS(f"AI detector {detector.name} is ready"))
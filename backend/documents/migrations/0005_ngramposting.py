@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 20:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_document__highlights'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NGramPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.BigIntegerField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ngram_postings', to='documents.document')),
+            ],
+            options={
+                'unique_together': {('gram', 'document')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_minhash_lsh'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIChunkResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=200)),
+                ('chunk_hash', models.CharField(max_length=64)),
+                ('label', models.CharField(max_length=32)),
+                ('score', models.FloatField()),
+                ('last_used', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'unique_together': {('model', 'chunk_hash')},
+            },
+        ),
+    ]
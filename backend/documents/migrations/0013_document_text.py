@@ -0,0 +1,54 @@
+# Generated by Django 5.2 on 2026-10-17 21:00
+
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def compress_contents(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    DocumentText = apps.get_model('documents', 'DocumentText')
+    rows = Document.objects.values_list('pk', 'content')
+    batch = []
+    for pk, content in rows.iterator(chunk_size=100):
+        batch.append(DocumentText(document_id=pk, data=zlib.compress(content.encode('utf-8'), 6)))
+        if len(batch) >= 100:
+            DocumentText.objects.bulk_create(batch)
+            batch = []
+    DocumentText.objects.bulk_create(batch)
+
+
+def restore_contents(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    DocumentText = apps.get_model('documents', 'DocumentText')
+    for pk, data in DocumentText.objects.values_list('document_id', 'data').iterator(chunk_size=100):
+        Document.objects.filter(pk=pk).update(content=zlib.decompress(data).decode('utf-8'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_document_user_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stored_text', serialize=False, to='documents.document')),
+                ('data', models.BinaryField()),
+            ],
+        ),
+        migrations.RunPython(compress_contents, restore_contents),
+        # a default lets the column be re-added (and refilled) on rollback
+        migrations.AlterField(
+            model_name='document',
+            name='content',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='document',
+            name='content',
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-17 21:24
+
+import os
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_file_names(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    for pk, file in Document.objects.values_list('pk', 'file').iterator(chunk_size=100):
+        Document.objects.filter(pk=pk).update(file_name=os.path.basename(file))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_document_text'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.document'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='file_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(fill_file_names, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='document',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='documents.document'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['user', 'file_name'], name='documents_d_user_id_1831ae_idx'),
+        ),
+    ]
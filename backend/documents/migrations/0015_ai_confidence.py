@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 21:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_document_revisions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='ai_scan',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='ai_confidence',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,116 @@
+import hashlib
+import re
+import unicodedata
+import zlib
+from collections import Counter
+
+from django.db import migrations
+
+# a frozen copy of documents.normalize.canonical_text with the default
+# TEXT_* settings (no case folding, boilerplate and references stripped),
+# so this migration hashes the same way whatever normalize becomes
+_SPECIAL = re.compile(
+    r'(?P<hyphen>(?<=[^\W\d_])-[ \t]*\r?\n\s*(?=[a-zß-ÿ]))'
+    r'|(?P<space>\s{2,}|[^\S ])'
+    r'|(?P<unicode>\S?[^\x00-\x7f\s]+)'
+)
+_LINE = re.compile(r'[^\n]*\n?')
+_PAGE_NUMBER = re.compile(r'\s*(page\s+)?\d{1,4}(\s*(of|/)\s*\d{1,4})?\s*', re.IGNORECASE)
+_REFERENCES = re.compile(
+    r'\s*(\d+(\.\d+)*[.)]?\s+)?(references|bibliography|works cited|literature cited|reference list|sources)\s*:?\s*',
+    re.IGNORECASE
+)
+
+
+def _dropped_ranges(text):
+    lines = [(m.start(), m.end()) for m in _LINE.finditer(text) if m.end() > m.start()]
+    dropped = []
+    end_of_body = len(text)
+    for start, end in reversed(lines):
+        if start < len(text) // 2:
+            break
+        if _REFERENCES.fullmatch(text[start:end]):
+            end_of_body = start
+            break
+    counts = Counter(text[start:end].strip() for start, end in lines)
+    for start, end in lines:
+        if start >= end_of_body:
+            break
+        line = text[start:end].strip()
+        if line and (
+            _PAGE_NUMBER.fullmatch(line)
+            or (counts[line] >= 3 and len(line) <= 80 and line[-1] not in '.?!')
+        ):
+            dropped.append((start, end))
+    if end_of_body < len(text):
+        dropped.append((end_of_body, len(text)))
+    return dropped
+
+
+def _normalize_unicode(run):
+    clusters = []
+    for ch in run:
+        if ch == '\u00ad':
+            continue
+        if clusters and unicodedata.combining(ch):
+            clusters[-1] += ch
+        else:
+            clusters.append(ch)
+    return ''.join(unicodedata.normalize('NFKC', cluster) for cluster in clusters)
+
+
+def canonical_text(text):
+    pieces = []
+    position = 0
+    for drop_start, drop_end in _dropped_ranges(text) + [(len(text), len(text))]:
+        for m in _SPECIAL.finditer(text, position, drop_start):
+            pieces.append(text[position:m.start()])
+            position = m.end()
+            if m.lastgroup == 'space':
+                pieces.append(' ')
+            elif m.lastgroup == 'unicode':
+                pieces.append(_normalize_unicode(m.group()))
+        pieces.append(text[position:drop_start])
+        position = drop_end
+    return ''.join(pieces).replace('\n', ' ')
+
+
+def rehash(apps, canonical):
+    Document = apps.get_model('documents', 'Document')
+    DocumentText = apps.get_model('documents', 'DocumentText')
+    hashes = {}
+    seen = set()
+    rows = DocumentText.objects.order_by('document_id').values_list('document_id', 'data')
+    for pk, data in rows.iterator(chunk_size=100):
+        text = zlib.decompress(data).decode('utf-8')
+        if canonical:
+            text = canonical_text(text)
+        digest = hashlib.md5(text.encode('utf-8')).hexdigest()
+        # documents that now normalize alike keep distinct hashes; the
+        # earliest one is the one found by hash
+        hashes[pk] = digest if digest not in seen else f'{digest}-{pk}'
+        seen.add(digest)
+    # through placeholders, so no row briefly takes a hash another still holds
+    for pk in hashes:
+        Document.objects.filter(pk=pk).update(content_hash=f'rehash-{pk}')
+    for pk, digest in hashes.items():
+        Document.objects.filter(pk=pk).update(content_hash=digest)
+
+
+def canonical_hashes(apps, schema_editor):
+    rehash(apps, canonical=True)
+
+
+def raw_hashes(apps, schema_editor):
+    rehash(apps, canonical=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_ai_confidence'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonical_hashes, raw_hashes),
+    ]
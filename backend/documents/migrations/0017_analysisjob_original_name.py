@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 22:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0016_canonical_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
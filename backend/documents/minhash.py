@@ -0,0 +1,102 @@
+# documents/minhash.py
+"""
+MinHash signatures plus an LSH banding table used as a near-duplicate
+pre-filter: a document becomes a candidate source when at least one band
+of its signature hashes to the same bucket as the upload's, so lookup
+cost depends on the number of bands, not on the size of the corpus.
+"""
+import hashlib
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from .shingles import document_grams
+from .models import Document, LSHBucket, MinHashSignature
+from .normalize import canonical_text
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_SHINGLE_BATCH = 8192
+
+
+def _permutations(num_perm):
+    """Fixed (a, b) pairs for the universal hashes (a * x + b) mod p."""
+    rng = np.random.RandomState(1)
+    a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+def signature(text):
+    """MinHash signature (uint32 array of MINHASH_PERMUTATIONS) of text."""
+    num_perm = settings.MINHASH_PERMUTATIONS
+    sig = np.full(num_perm, _MAX_HASH, dtype=np.uint64)
+    shingles = document_grams(text, n=settings.MINHASH_SHINGLE_SIZE)
+    if not shingles:
+        return sig.astype(np.uint32)
+
+    # 32-bit shingles and coefficients keep a * x + b below 2**64
+    x = np.fromiter(shingles, dtype=np.int64, count=len(shingles)).astype(np.uint64) & _MAX_HASH
+    a, b = _permutations(num_perm)
+    for i in range(0, len(x), _SHINGLE_BATCH):
+        hv = ((a * x[i:i + _SHINGLE_BATCH] + b) % _MERSENNE) & _MAX_HASH
+        np.minimum(sig, hv.min(axis=1), out=sig)
+    return sig.astype(np.uint32)
+
+
+def band_buckets(sig):
+    """(band, bucket) pairs of a signature split into LSH_BANDS bands."""
+    rows = len(sig) // settings.LSH_BANDS
+    buckets = []
+    for band in range(settings.LSH_BANDS):
+        digest = hashlib.blake2b(sig[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'big', signed=True)))
+    return buckets
+
+
+def index_minhash(document):
+    """(Re)build the signature and LSH buckets of a single document."""
+    sig = signature(canonical_text(document.content)[0])
+    MinHashSignature.objects.update_or_create(
+        document=document,
+        defaults={'signature': sig.tobytes()}
+    )
+    LSHBucket.objects.filter(document=document).delete()
+    LSHBucket.objects.bulk_create(
+        [LSHBucket(band=band, bucket=bucket, document=document) for band, bucket in band_buckets(sig)],
+        ignore_conflicts=True
+    )
+
+
+def lsh_candidates(text, exclude_hash=None):
+    """
+    Ids of documents colliding with text in at least one LSH band whose
+    estimated Jaccard similarity is at least LSH_THRESHOLD, most similar
+    first, capped at PLAGIARISM_MAX_CANDIDATES.
+    """
+    sig = signature(text)
+    query = Q()
+    for band, bucket in band_buckets(sig):
+        query |= Q(band=band, bucket=bucket)
+    colliding = Counter(LSHBucket.objects.filter(query).values_list('document_id', flat=True))
+
+    if exclude_hash:
+        for pk in Document.objects.filter(content_hash=exclude_hash).values_list('pk', flat=True):
+            colliding.pop(pk, None)
+    if not colliding:
+        return []
+
+    scored = []
+    rows = MinHashSignature.objects.filter(document_id__in=list(colliding)).values_list('document_id', 'signature')
+    for pk, stored in rows:
+        other = np.frombuffer(bytes(stored), dtype=np.uint32)
+        if len(other) != len(sig):
+            continue
+        jaccard = float(np.mean(other == sig))
+        if jaccard >= settings.LSH_THRESHOLD:
+            scored.append((jaccard, pk))
+
+    scored.sort(reverse=True)
+    return [pk for _, pk in scored[:settings.PLAGIARISM_MAX_CANDIDATES]]
@@ -1,22 +1,191 @@
 # documents/models.py
-from django.db import models
+import zlib
+
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 class Document(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    content = models.TextField()
     plagiarism_score = models.FloatField()
     ai_score = models.FloatField()
     _highlights = models.JSONField(default=list)
     content_hash= models.CharField(max_length=64, unique=True)
+    # sha256 of the uploaded bytes in `file`
+    file_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # corpus version at insert, and the one the scores were computed against
+    version = models.BigIntegerField(default=0, db_index=True)
+    analysis_version = models.BigIntegerField(null=True, blank=True)
+    # PLAGIARISM_MODE of that analysis
+    analysis_mode = models.CharField(max_length=20, blank=True)
+    # AI score before capping by the plagiarism score
+    ai_raw_score = models.FloatField(null=True, blank=True)
+    # its interval and chunks scored: {'low', 'high', 'sampled', 'total'}
+    ai_confidence = models.JSONField(null=True, blank=True)
     file = models.FileField(upload_to='documents/')
+    # name of the uploaded file, and the earlier draft this one revises
+    file_name = models.CharField(max_length=255, blank=True)
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='revisions')
     created_at = models.DateTimeField(auto_now_add=True)
     word_count = models.IntegerField()
     character_count = models.IntegerField()
     page_count = models.IntegerField()
     reading_time = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['user', 'file_name']),
+        ]
+
+    # the text is stored compressed in DocumentText, off the main row
+    _content = None
+    _content_dirty = False
+
+    @property
+    def content(self):
+        """Extracted text, read from DocumentText on first access."""
+        if self._content is None:
+            try:
+                self._content = DocumentText.unpack(self.stored_text.data) if self.pk else ''
+            except DocumentText.DoesNotExist:
+                self._content = ''
+        return self._content
+
+    @content.setter
+    def content(self, text):
+        self._content = text
+        self._content_dirty = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self._content_dirty:
+                DocumentText.objects.update_or_create(
+                    document=self,
+                    defaults={'data': DocumentText.pack(self._content)}
+                )
+                self._content_dirty = False
+
     @property
     def highlights(self):
-        return self._highlights
\ No newline at end of file
+        return self._highlights
+
+
+class DocumentText(models.Model):
+    """A document's extracted text, zlib-compressed."""
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='stored_text')
+    data = models.BinaryField()
+
+    @staticmethod
+    def pack(text):
+        return zlib.compress(text.encode('utf-8'), 6)
+
+    @staticmethod
+    def unpack(data):
+        return zlib.decompress(data).decode('utf-8')
+
+class CorpusVersion(models.Model):
+    """Singleton counter bumped on every Document insert and delete."""
+    version = models.BigIntegerField(default=0)
+    # version of the most recent delete
+    last_delete = models.BigIntegerField(default=0)
+
+    @classmethod
+    def current(cls):
+        """(version, last_delete)"""
+        return cls.objects.filter(pk=1).values_list('version', 'last_delete').first() or (0, 0)
+
+    @classmethod
+    def bump(cls, deleted=False):
+        """Advance the version and return the new one."""
+        cls.objects.get_or_create(pk=1)
+        updates = {'version': F('version') + 1}
+        if deleted:
+            updates['last_delete'] = F('version') + 1
+        with transaction.atomic():
+            cls.objects.filter(pk=1).update(**updates)
+            return cls.objects.values_list('version', flat=True).get(pk=1)
+
+
+class ExtractedText(models.Model):
+    """Extraction cache: raw upload hash -> document holding the text extracted from it."""
+    file_hash = models.CharField(max_length=64, unique=True)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='extractions')
+
+
+class NGramPosting(models.Model):
+    """Inverted index entry: hashed character 5-gram -> document containing it."""
+    gram = models.BigIntegerField()
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ngram_postings')
+
+    class Meta:
+        unique_together = ('gram', 'document')
+
+
+class Fingerprint(models.Model):
+    """Winnowed k-gram fingerprint (MOSS-style) of a document."""
+    hash = models.BigIntegerField()
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='fingerprints')
+
+    class Meta:
+        unique_together = ('hash', 'document')
+
+
+class MinHashSignature(models.Model):
+    """MinHash signature of a document's shingles (uint32 array as bytes)."""
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='minhash')
+    signature = models.BinaryField()
+
+
+class LSHBucket(models.Model):
+    """LSH banding table entry: (band, hash of that band's rows) -> document."""
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='lsh_buckets')
+
+    class Meta:
+        unique_together = ('band', 'bucket', 'document')
+
+
+class AIChunkResult(models.Model):
+    """Cached AI-detector prediction for one chunk of text, evicted least recently used first."""
+    model = models.CharField(max_length=200)
+    chunk_hash = models.CharField(max_length=64)
+    label = models.CharField(max_length=32)
+    score = models.FloatField()
+    last_used = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = ('model', 'chunk_hash')
+
+
+class AnalysisJob(models.Model):
+    """Queued analysis of an uploaded file, processed by `run_analysis_worker`."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    file = models.FileField(upload_to='documents/')
+    # the upload's own name (storage may rename file), for find_parent
+    original_name = models.CharField(max_length=255, blank=True)
+    # explicit earlier draft of the upload (see find_parent)
+    parent = models.ForeignKey(Document, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    # requested AI scan mode, blank for AI_SCAN_MODE
+    ai_scan = models.CharField(max_length=10, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
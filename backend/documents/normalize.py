@@ -0,0 +1,151 @@
+# documents/normalize.py
+"""
+Text canonicalization shared by hashing, indexing and both detectors:
+Unicode NFKC, dehyphenation of words broken across lines, whitespace
+collapsing, optional case folding, and removal of page furniture (page
+numbers, running headers and footers) and of the references section.
+Each normalized text comes with the offset of every character in the
+original, so spans found in it map back to the extracted text.
+"""
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+
+# a word broken across lines ("exam-\nple", lowercase continuation);
+# whitespace runs (single spaces are left alone); non-ASCII characters,
+# with the character they may combine with
+_SPECIAL = re.compile(
+    r'(?P<hyphen>(?<=[^\W\d_])-[ \t]*\r?\n\s*(?=[a-zß-ÿ]))'
+    r'|(?P<space>\s{2,}|[^\S ])'
+    r'|(?P<unicode>\S?[^\x00-\x7f\s]+)'
+)
+SOFT_HYPHEN = '\u00ad'
+_LINE = re.compile(r'[^\n]*\n?')
+_PAGE_NUMBER = re.compile(r'\s*(page\s+)?\d{1,4}(\s*(of|/)\s*\d{1,4})?\s*', re.IGNORECASE)
+_REFERENCES = re.compile(
+    r'\s*(\d+(\.\d+)*[.)]?\s+)?(references|bibliography|works cited|literature cited|reference list|sources)\s*:?\s*',
+    re.IGNORECASE
+)
+# a short line, not ending a sentence, seen this often is a running header
+# or footer
+BOILERPLATE_REPEATS = 3
+BOILERPLATE_MAX_LENGTH = 80
+
+
+def dropped_ranges(text, boilerplate=True, references=True):
+    """(start, end) ranges of text left out of the normalized form, in order."""
+    lines = [(m.start(), m.end()) for m in _LINE.finditer(text) if m.end() > m.start()]
+    dropped = []
+    end_of_body = len(text)
+    if references:
+        # the last references heading in the second half of the document
+        for start, end in reversed(lines):
+            if start < len(text) // 2:
+                break
+            if _REFERENCES.fullmatch(text[start:end]):
+                end_of_body = start
+                break
+    if boilerplate:
+        counts = Counter(text[start:end].strip() for start, end in lines)
+        for start, end in lines:
+            if start >= end_of_body:
+                break
+            line = text[start:end].strip()
+            if line and (
+                _PAGE_NUMBER.fullmatch(line)
+                or (
+                    counts[line] >= BOILERPLATE_REPEATS
+                    and len(line) <= BOILERPLATE_MAX_LENGTH
+                    and line[-1] not in '.?!'
+                )
+            ):
+                dropped.append((start, end))
+    if end_of_body < len(text):
+        dropped.append((end_of_body, len(text)))
+    return dropped
+
+
+def normalize(text, casefold=False, boilerplate=True, references=True):
+    """
+    (normalized text, offsets): offsets[i] is the index in text of the
+    i-th normalized character. Whitespace runs become one space, or one
+    newline if they contain a line break.
+    """
+    pieces = []
+    offsets = []
+    position = 0
+    for drop_start, drop_end in dropped_ranges(text, boilerplate, references) + [(len(text), len(text))]:
+        _normalize_range(text, position, drop_start, casefold, pieces, offsets)
+        position = drop_end
+    return ''.join(pieces), offsets
+
+
+def _normalize_range(text, start, end, casefold, pieces, offsets):
+    position = start
+    for m in _SPECIAL.finditer(text, start, end):
+        _copy(text, position, m.start(), casefold, pieces, offsets)
+        position = m.end()
+        if m.lastgroup == 'space':
+            pieces.append('\n' if '\n' in m.group() else ' ')
+            offsets.append(m.start())
+        elif m.lastgroup == 'unicode':
+            _normalize_unicode(m.group(), m.start(), casefold, pieces, offsets)
+    _copy(text, position, end, casefold, pieces, offsets)
+
+
+def _copy(text, start, end, casefold, pieces, offsets):
+    if end > start:
+        pieces.append(text[start:end].lower() if casefold else text[start:end])
+        offsets.extend(range(start, end))
+
+
+def _normalize_unicode(run, start, casefold, pieces, offsets):
+    """NFKC (and case folding) one base character and its combining marks at a time; soft hyphens go."""
+    clusters = []
+    for i, ch in enumerate(run):
+        if ch == SOFT_HYPHEN:
+            continue
+        if clusters and unicodedata.combining(ch):
+            clusters[-1][1] += ch
+        else:
+            clusters.append([start + i, ch])
+    for position, cluster in clusters:
+        out = unicodedata.normalize('NFKC', cluster)
+        if casefold:
+            out = out.casefold()
+        pieces.append(out)
+        offsets.extend([position] * len(out))
+
+
+def canonical_text(text):
+    """
+    normalize() with the TEXT_* settings and line breaks as spaces (so PDF
+    and DOCX extractions of a document agree): the form that is hashed,
+    indexed and compared for plagiarism.
+    """
+    normalized, offsets = normalize(
+        text,
+        casefold=settings.TEXT_CASEFOLD,
+        boilerplate=settings.TEXT_STRIP_BOILERPLATE,
+        references=settings.TEXT_STRIP_REFERENCES
+    )
+    return normalized.replace('\n', ' '), offsets
+
+
+def model_text(text):
+    """
+    normalize() as the AI detector reads it: never case folded, and with
+    line breaks kept since chunk boundaries follow them.
+    """
+    return normalize(
+        text,
+        boilerplate=settings.TEXT_STRIP_BOILERPLATE,
+        references=settings.TEXT_STRIP_REFERENCES
+    )
+
+
+def original_span(offsets, start, end):
+    """The (start, end) range of the original text behind normalized[start:end]."""
+    return offsets[start], offsets[end - 1] + 1
@@ -0,0 +1,11 @@
+# documents/pagination.py
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class DocumentCursorPagination(CursorPagination):
+    """Newest first; the cursor keeps deep pages as cheap as the first one."""
+    page_size = settings.DOCUMENTS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,40 @@
+# documents/pools.py
+"""
+Process pools shared by all requests, each started on first use.
+
+The workers come from a forkserver (spawn where there is none), never from a
+fork of a request thread: a forked child would copy whatever locks the web
+server's other threads held at that moment. Keep this module free of model
+imports; workers import it before Django is set up.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def _start_method():
+    methods = multiprocessing.get_all_start_methods()
+    return 'forkserver' if 'forkserver' in methods else 'spawn'
+
+
+def _setup_worker():
+    # a fresh interpreter: tasks import documents.* modules, which need the app registry
+    django.setup()
+
+
+def process_pool(name, workers):
+    """The shared pool called name, started with workers processes on first use."""
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(_start_method()),
+                initializer=_setup_worker
+            )
+        return pool
@@ -0,0 +1,99 @@
+# documents/revisions.py
+"""
+Line diff between a document and its revised draft: which stretches of
+the new text are carried over unchanged from the old one (and from where),
+and which need analyzing again.
+"""
+import difflib
+from bisect import bisect_right
+
+from .utils import calculate_position
+
+# re-analyzed regions take this much unchanged context on each side, so
+# 200-char windows and matches crossing an edit are found again
+CONTEXT = 200
+
+
+def line_starts(lines):
+    starts = [0]
+    for line in lines:
+        starts.append(starts[-1] + len(line))
+    return starts
+
+
+def unchanged_blocks(old, new):
+    """
+    (old_start, new_start, length) character ranges identical in both
+    texts, in order, from a diff of their lines. Close to linear in the
+    text size when the drafts mostly agree.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    old_starts = line_starts(old_lines)
+    new_starts = line_starts(new_lines)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [
+        (old_starts[i], new_starts[j], new_starts[j + n] - new_starts[j])
+        for i, j, n in matcher.get_matching_blocks()
+        if n
+    ]
+
+
+def changed_regions(blocks, old_length, new_length, context=CONTEXT):
+    """
+    (start, end) ranges of the new text that were inserted or rewritten, or
+    around which something was deleted, widened by context and merged.
+    """
+    regions = []
+    old_end = new_end = 0
+    for old_start, new_start, size in blocks + [(old_length, new_length, 0)]:
+        if old_start > old_end or new_start > new_end:
+            start, end = max(new_end - context, 0), min(new_start + context, new_length)
+            if regions and start <= regions[-1][1]:
+                regions[-1] = (regions[-1][0], end)
+            else:
+                regions.append((start, end))
+        old_end, new_end = old_start + size, new_start + size
+    return regions
+
+
+def join_regions(text, regions):
+    """The regions of text, one per line, so they are analyzed in a single pass."""
+    return '\n'.join(text[start:end] for start, end in regions)
+
+
+def split_span(regions, start, end):
+    """The (start, end) pieces of the text covered by a span of join_regions(text, regions)."""
+    pieces = []
+    offset = 0
+    for region_start, region_end in regions:
+        length = region_end - region_start
+        if start < offset + length and end > offset:
+            pieces.append((region_start + max(start - offset, 0), region_start + min(end - offset, length)))
+        offset += length + 1
+    return pieces
+
+
+def carry_over(highlights, blocks, text, regions):
+    """
+    The highlights of the old text moved to their offsets in the new text,
+    cut down to the unchanged blocks they cover, bar the pieces inside one
+    of the regions (which are analyzed again).
+    """
+    old_starts = [old_start for old_start, _, _ in blocks]
+    region_starts = [start for start, _ in regions]
+    moved = []
+    for h in highlights:
+        i = max(bisect_right(old_starts, h['start']) - 1, 0)
+        for old_start, new_start, size in blocks[i:]:
+            if old_start >= h['end']:
+                break
+            if old_start + size <= h['start']:
+                continue
+            start = max(h['start'], old_start) - old_start + new_start
+            end = min(h['end'], old_start + size) - old_start + new_start
+            r = bisect_right(region_starts, start) - 1
+            if r >= 0 and end <= regions[r][1]:
+                continue
+            moved.append({**h, 'position': calculate_position(text, start, end), 'start': start, 'end': end})
+    return moved
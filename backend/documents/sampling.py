@@ -0,0 +1,68 @@
+# documents/sampling.py
+"""
+Adaptive AI scoring: a document's chunks are scored in stratified,
+content-keyed order and the scan stops once the confidence interval of their mean score
+is narrower than AI_SAMPLING_TOLERANCE (or AI_SAMPLING_MAX_CHUNKS were
+scored), so long documents cost a bounded number of forward passes.
+"""
+import math
+
+from django.conf import settings
+
+# two-sided 95% normal quantile
+Z = 1.96
+
+
+def stratified_order(keys, strata):
+    """
+    The chunk indices in the order to score them, given one key per chunk
+    (a hash of its content): the document is cut into strata equal slices,
+    each ordered by key, and the slices are visited round-robin, so every
+    prefix of strata chunks spans the whole document. A chunk's place in
+    its slice depends on its own content only, so an edit elsewhere leaves
+    the sample (and the cached predictions it hits) mostly the same.
+    """
+    count = len(keys)
+    strata = max(1, min(strata, count))
+    bounds = [count * i // strata for i in range(strata + 1)]
+    slices = [
+        sorted(range(bounds[i], bounds[i + 1]), key=lambda j: (keys[j], j))
+        for i in range(strata)
+    ]
+    order = []
+    for r in range(max((len(s) for s in slices), default=0)):
+        order.extend(s[r] for s in slices if r < len(s))
+    return order
+
+
+def confidence_interval(scores, total):
+    """
+    95% interval (low, high) for the mean score of total chunks given the
+    scores of a sample of them. Uses the simple random sampling variance
+    with finite population correction, which overstates the variance of a
+    stratified sample, so the interval errs on the wide side.
+    """
+    k = len(scores)
+    if not k:
+        return 0.0, 100.0
+    mean = sum(scores) / k
+    if k >= total:
+        return mean, mean
+    if k < 2:
+        return 0.0, 100.0
+    variance = sum((s - mean) ** 2 for s in scores) / (k - 1)
+    half = Z * math.sqrt(variance / k * (total - k) / (total - 1))
+    return max(mean - half, 0.0), min(mean + half, 100.0)
+
+
+def settled(scores, total):
+    """Whether an adaptive scan can stop after scoring these chunks."""
+    k = len(scores)
+    if k >= total:
+        return True
+    if k < settings.AI_SAMPLING_MIN_CHUNKS:
+        return False
+    if settings.AI_SAMPLING_MAX_CHUNKS and k >= settings.AI_SAMPLING_MAX_CHUNKS:
+        return True
+    low, high = confidence_interval(scores, total)
+    return high - low <= settings.AI_SAMPLING_TOLERANCE
@@ -26,12 +26,20 @@ class TextAnalysisSerializer(serializers.Serializer):
     ai_generated_content = serializers.FloatField()
 
 class DocumentSerializer(serializers.ModelSerializer):
-    fileUrl = serializers.SerializerMethodField()
-    highlights = serializers.SerializerMethodField()
+    fileUrl = serializers.SerializerMethodField(method_name='get_file_url')
+    highlights = serializers.ReadOnlyField()
 
     class Meta:
         model = Document
-        fields = '__all__'
+        # the text (stored apart) is only served on request: DocumentContentSerializer;
+        # the highlights go out once, through the `highlights` property
+        exclude = ('_highlights',)
+        # set by the analysis only: scores, cache keys and the draft lineage
+        # (which decides the sources a revision is checked against)
+        read_only_fields = (
+            'user', 'content_hash', 'file_hash', 'version', 'analysis_version',
+            'analysis_mode', 'ai_raw_score', 'ai_confidence', 'parent'
+        )
 
     def get_file_url(self, obj):
         request = self.context.get('request')
@@ -42,4 +50,13 @@ class DocumentSerializer(serializers.ModelSerializer):
     def get_format(self, obj):
         if obj.file:
             return obj.file.name.split('.')[-1].lower()
-        return 'unknown'
\ No newline at end of file
+        return 'unknown'
+
+
+class DocumentListSerializer(DocumentSerializer):
+    # a list entry leaves the highlights to the detail response
+    highlights = None
+
+
+class DocumentContentSerializer(DocumentSerializer):
+    content = serializers.ReadOnlyField()
@@ -0,0 +1,32 @@
+# documents/shingles.py
+import hashlib
+import re
+
+NGRAM_SIZE = 5
+_white_spaces = re.compile(r"\s\s+")
+
+
+def hash_gram(gram):
+    """Stable signed 64-bit hash of an n-gram (fits a BigIntegerField)."""
+    digest = hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def document_grams(text, n=NGRAM_SIZE):
+    """
+    Hashed character n-grams of text, preprocessed the same way as
+    TfidfVectorizer(analyzer='char') so index hits line up with the scoring.
+    """
+    text = _white_spaces.sub(' ', text.lower())
+    grams = {text[i:i + n] for i in range(len(text) - n + 1)}
+    return {hash_gram(g) for g in grams}
+
+
+def alnum_chars(text):
+    """Lowercased alphanumerics of text plus each one's offset in the original."""
+    chars, offsets = [], []
+    for i, ch in enumerate(text):
+        if ch.isalnum():
+            chars.append(ch.lower())
+            offsets.append(i)
+    return ''.join(chars), offsets
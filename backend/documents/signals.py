@@ -0,0 +1,51 @@
+# documents/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .index import update_indexes
+from .models import CorpusVersion, Document
+
+
+@receiver(pre_save, sender=Document)
+def track_content_change(sender, instance, **kwargs):
+    """Remember whether the text changed so score-only saves skip re-indexing."""
+    if instance.pk is None:
+        instance._content_changed = True
+        return
+    old_hash = (
+        Document.objects
+        .filter(pk=instance.pk)
+        .values_list('content_hash', flat=True)
+        .first()
+    )
+    instance._content_changed = old_hash != instance.content_hash
+
+
+@receiver(post_save, sender=Document)
+def update_plagiarism_index(sender, instance, created, **kwargs):
+    """Keep the plagiarism index in sync; deletions cascade to it."""
+    if created or getattr(instance, '_content_changed', True):
+        update_indexes(instance)
+
+
+@receiver(post_save, sender=Document)
+def stamp_corpus_version(sender, instance, created, **kwargs):
+    """
+    New documents advance the corpus version and record it once committed,
+    so the counter's row is locked only for the bump, not for the save and
+    indexing around it. A document analyzed in between sees an older
+    version and picks this one up as added.
+    """
+    if created:
+        transaction.on_commit(lambda: stamp_version(instance))
+
+
+def stamp_version(instance):
+    instance.version = CorpusVersion.bump()
+    Document.objects.filter(pk=instance.pk).update(version=instance.version)
+
+
+@receiver(post_delete, sender=Document)
+def bump_corpus_version(sender, instance, **kwargs):
+    transaction.on_commit(lambda: CorpusVersion.bump(deleted=True))
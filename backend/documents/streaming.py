@@ -0,0 +1,107 @@
+# documents/streaming.py
+"""
+Bounded-memory comparison against the whole corpus: stored texts are
+streamed in chunks sized to PLAGIARISM_STREAM_MEMORY_MB and featurized with
+a stateless hashing vectorizer (no vocabulary to fit), and only the
+PLAGIARISM_STREAM_TOP_K sources matching the most windows are kept.
+"""
+import heapq
+
+import numpy as np
+from django.conf import settings
+
+from .models import Document
+from .texts import iter_document_texts
+
+WINDOW = 200
+STEP = 100
+THRESHOLD = 0.3
+# rough working set per corpus character: the string plus its hashed
+# 5-gram row (float64 value + int32 index per n-gram)
+BYTES_PER_CHAR = 16
+
+_vectorizer = None
+
+
+def get_vectorizer():
+    """The (stateless) hashing featurizer, with scikit-learn imported on first use."""
+    global _vectorizer
+    if _vectorizer is None:
+        from sklearn.feature_extraction.text import HashingVectorizer
+        _vectorizer = HashingVectorizer(
+            analyzer='char',
+            ngram_range=(5, 5),
+            n_features=2 ** 20,
+            alternate_sign=False,
+            norm='l2'
+        )
+    return _vectorizer
+
+
+def streamed_spans(text, exclude_hash=None, candidate_ids=None, progress=None, exclude_ids=()):
+    """
+    (start, end, document_id) of the 200-char windows of text whose cosine
+    similarity with one of the top-k sources exceeds 0.3, each attributed
+    to the source matching the most windows. Scans every stored document
+    (or only candidate_ids) bar exclude_ids. progress(done, total, spans), if given, is
+    called after each chunk of documents with the (start, end) windows
+    matched so far.
+    """
+    starts = list(range(0, len(text) - WINDOW + 1, STEP))
+    if not starts:
+        return []
+    vectorizer = get_vectorizer()
+    windows = vectorizer.transform([text[start:start + WINDOW] for start in starts])
+
+    excluded = set(exclude_ids)
+    if exclude_hash:
+        excluded.update(Document.objects.filter(content_hash=exclude_hash).values_list('pk', flat=True))
+    total = len(candidate_ids) if candidate_ids is not None else Document.objects.count()
+    budget = settings.PLAGIARISM_STREAM_MEMORY_MB * 1024 * 1024
+
+    # min-heap of (matched windows, document id, window mask), at most k entries
+    top = []
+    k = settings.PLAGIARISM_STREAM_TOP_K
+    done = 0
+
+    def flush(ids, texts):
+        sims = (windows @ vectorizer.transform(texts).T).tocsc()
+        for j, pk in enumerate(ids):
+            column = sims[:, j]
+            mask = np.zeros(len(starts), dtype=bool)
+            mask[column.indices[column.data > THRESHOLD]] = True
+            matched = int(mask.sum())
+            if not matched:
+                continue
+            if len(top) < k:
+                heapq.heappush(top, (matched, pk, mask))
+            elif matched > top[0][0]:
+                heapq.heapreplace(top, (matched, pk, mask))
+        if progress:
+            covered = np.zeros(len(starts), dtype=bool)
+            for _, _, mask in top:
+                covered |= mask
+            progress(done, total, [(starts[i], starts[i] + WINDOW) for i in np.flatnonzero(covered)])
+
+    ids, texts, size = [], [], 0
+    for pk, content in iter_document_texts(candidate_ids, chunk_size=settings.PLAGIARISM_STREAM_CHUNK_SIZE):
+        done += 1
+        if pk in excluded:
+            continue
+        ids.append(pk)
+        texts.append(content)
+        size += len(content) * BYTES_PER_CHAR
+        if size >= budget:
+            flush(ids, texts)
+            ids, texts, size = [], [], 0
+    if ids:
+        flush(ids, texts)
+
+    # each matched window goes to the source matching the most windows overall
+    spans = []
+    claimed = np.zeros(len(starts), dtype=bool)
+    for matched, pk, mask in sorted(top, reverse=True):
+        spans.extend((starts[i], starts[i] + WINDOW, pk) for i in np.flatnonzero(mask & ~claimed))
+        claimed |= mask
+    spans.sort()
+    return spans
@@ -1,3 +1,570 @@
-from django.test import TestCase
+import hashlib
+import importlib
+import multiprocessing
+import os
+import random
+import re
+import tempfile
+import unittest
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from huggingface_hub import try_to_load_from_cache
+
+from .alignment import SuffixAutomaton, merge_spans
+from .analysis import calculate_content_hash, lineage
+from .detectors import OnnxDetector, TorchDetector
+from .minhash import band_buckets, signature
+from .jobs import process_job
+from .models import AnalysisJob, CorpusVersion, Document
+from .normalize import canonical_text, model_text, normalize, original_span
+from .revisions import carry_over, changed_regions, join_regions, split_span, unchanged_blocks
+from .sampling import confidence_interval, settled, stratified_order
+from .serializers import DocumentListSerializer, DocumentSerializer
+from .shingles import alnum_chars, document_grams
+from .utils import analyze_text, calculate_document_stats, token_chunks
+from .winnowing import fingerprints, kgram_hashes, winnow
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+SAMPLES = [
+    "The results indicate that the proposed framework significantly improves efficiency across all evaluated metrics.",
+    "honestly i wrote most of this the night before, the printer broke twice and my notes are a mess lol",
+    "In conclusion, it is important to note that artificial intelligence offers numerous benefits and challenges.",
+    "We interviewed 42 farmers in Masvingo province between March and June; most reported late rains.",
+    "Short.",
+]
+
+
+def model_on_disk(model_id):
+    """A local model directory, or a Hub model already in the cache (no network call)."""
+    return os.path.isdir(model_id) or isinstance(try_to_load_from_cache(model_id, 'config.json'), str)
+
+
+requires_model = unittest.skipUnless(
+    model_on_disk(settings.AI_DETECTOR_MODEL), f"{settings.AI_DETECTOR_MODEL} is not downloaded"
+)
+
+
+@unittest.skipIf(onnxruntime is None, "onnxruntime is not installed")
+@requires_model
+class OnnxBackendParityTests(SimpleTestCase):
+    """The ONNX backend must agree with the torch pipeline it replaces."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            cls.torch_detector = TorchDetector(settings.AI_DETECTOR_MODEL)
+        except OSError as e:
+            raise unittest.SkipTest(f"{settings.AI_DETECTOR_MODEL} is not available: {e}")
+        cls.export_dir = tempfile.TemporaryDirectory()
+        cls.expected = cls.torch_detector(SAMPLES, batch_size=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.export_dir.cleanup()
+        super().tearDownClass()
+
+    def assertMatchesTorch(self, quantize, delta):
+        with override_settings(AI_ONNX_DIR=self.export_dir.name, AI_ONNX_QUANTIZE=quantize):
+            detector = OnnxDetector(settings.AI_DETECTOR_MODEL)
+            got = detector(SAMPLES, batch_size=2)
+        self.assertEqual(len(got), len(self.expected))
+        for expected, actual in zip(self.expected, got):
+            self.assertEqual(actual['label'], expected['label'])
+            self.assertAlmostEqual(actual['score'], expected['score'], delta=delta)
+
+    def test_float32_matches_torch(self):
+        self.assertMatchesTorch(quantize=False, delta=1e-3)
+
+    def test_int8_matches_torch(self):
+        self.assertMatchesTorch(quantize=True, delta=0.05)
+
+
+def private_memory():
+    """Bytes of this process's memory no other process shares (Linux USS)."""
+    total = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1]) * 1024
+    return total
+
+
+def score_and_report(detector, results):
+    detector(SAMPLES, batch_size=2)
+    results.put(private_memory())
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/smaps_rollup'), "needs Linux smaps_rollup")
+@requires_model
+class PreforkSharingTests(SimpleTestCase):
+    """Workers forked after the detector is loaded share its weights instead of copying them."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            with override_settings(AI_DETECTOR_MMAP=True):
+                cls.detector = TorchDetector(settings.AI_DETECTOR_MODEL)
+        except OSError as e:
+            raise unittest.SkipTest(f"{settings.AI_DETECTOR_MODEL} is not available: {e}")
+        model = cls.detector.pipeline.model
+        cls.weight_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        if cls.weight_bytes < 50 * 1024 * 1024:
+            raise unittest.SkipTest("model too small to tell shared weights from per-process overhead")
+        # preload: the parent has read every weight before forking
+        cls.detector(SAMPLES, batch_size=2)
+
+    def worker_memory(self, workers):
+        ctx = multiprocessing.get_context('fork')
+        results = ctx.SimpleQueue()
+        processes = [ctx.Process(target=score_and_report, args=(self.detector, results)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        memory = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        return memory
+
+    def test_private_memory_per_worker_stays_flat(self):
+        (alone,) = self.worker_memory(1)
+        for private in self.worker_memory(4):
+            # no worker holds its own copy of the weights...
+            self.assertLess(private, self.weight_bytes / 2)
+            # ...and adding workers does not make each one bigger
+            self.assertLess(private, alone * 1.25 + 16 * 1024 * 1024)
+
+
+PASSAGE = (
+    "Irrigation schedules in the lowveld were shifted by three weeks after the 2019 drought, "
+    "and smallholders who adopted drip kits reported yields close to the pre-drought average "
+    "while neighbours relying on furrows lost most of their maize to wilting in February. "
+)
+
+
+def make_document(user, text, **fields):
+    return Document.objects.create(
+        user=user, content=text, content_hash=calculate_content_hash(text),
+        plagiarism_score=0, ai_score=0, file='documents/test.txt',
+        **calculate_document_stats(text), **fields
+    )
+
+
+class RevisionLineageTests(TestCase):
+    """Another user's document never passes for one of your earlier drafts."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user(username='owner@x.com', email='owner@x.com', password='pw')
+        self.other = User.objects.create_user(username='other@x.com', email='other@x.com', password='pw')
+        self.source = make_document(self.owner, PASSAGE * 4)
+        self.dummy = make_document(self.other, "A placeholder draft about something else entirely. " * 8)
+
+    def test_parent_is_read_only(self):
+        serializer = DocumentSerializer(self.dummy, data={'parent': self.source.pk}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.dummy.refresh_from_db()
+        self.assertIsNone(self.dummy.parent_id)
+
+    def test_lineage_stops_at_other_users_documents(self):
+        # e.g. a link forged before parent was read-only
+        Document.objects.filter(pk=self.dummy.pk).update(parent=self.source)
+        draft = make_document(self.other, "Second placeholder draft, still unrelated. " * 8, parent=self.dummy)
+        self.assertEqual(lineage(draft.pk, self.other), [draft.pk, self.dummy.pk])
+        self.assertEqual(lineage(self.source.pk, self.other), [])
+
+    def test_queued_upload_revises_by_its_own_name(self):
+        drafts = [
+            PASSAGE[:240] + " This is the first draft of the thesis.",
+            PASSAGE[:240] + " This is the second draft of the thesis.",
+        ]
+        documents = []
+        # short enough to skip the AI model; its context makes every edit a large one
+        settings_ = {'ANALYSIS_PARALLEL_DETECTORS': False, 'ANALYSIS_REVISION_MAX_CHANGE': 1.0}
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media, **settings_):
+            for text in drafts:
+                job = AnalysisJob.objects.create(
+                    user=self.owner, file=SimpleUploadedFile('thesis.txt', text.encode('utf-8')),
+                    original_name='thesis.txt'
+                )
+                process_job(job)
+                self.assertEqual(job.status, AnalysisJob.DONE, job.error)
+                documents.append(Document.objects.get(pk=job.result['id']))
+        # the second copy was stored under another name
+        self.assertNotEqual(job.file.name, 'documents/thesis.txt')
+        self.assertEqual([d.file_name for d in documents], ['thesis.txt', 'thesis.txt'])
+        self.assertEqual(documents[1].parent_id, documents[0].pk)
+
+    def test_forged_parent_does_not_hide_the_source(self):
+        Document.objects.filter(pk=self.dummy.pk).update(parent=self.source)
+        copy = PASSAGE * 4 + "An added closing sentence of my own."
+        result = analyze_text(calculate_content_hash(copy), copy, exclude_ids=lineage(self.dummy.pk, self.other))
+        self.assertGreater(result['score'], 50)
+        hidden = analyze_text(calculate_content_hash(copy), copy, exclude_ids=[self.source.pk])
+        self.assertEqual(hidden['score'], 0.0)
+
+
+def chunk_keys(names):
+    return [hashlib.sha256(name.encode('utf-8')).hexdigest() for name in names]
+
+
+class DocumentSerializerTests(TestCase):
+    """Highlights go out once, and only in the detail response."""
+
+    def setUp(self):
+        User = get_user_model()
+        user = User.objects.create_user(username='owner@x.com', email='owner@x.com', password='pw')
+        self.document = make_document(user, PASSAGE, _highlights=[{'start': 0, 'end': 10}])
+        self.context = {'request': RequestFactory().get('/documents/')}
+
+    def test_detail_has_highlights_once(self):
+        data = DocumentSerializer(self.document, context=self.context).data
+        self.assertEqual(data['highlights'], [{'start': 0, 'end': 10}])
+        self.assertNotIn('_highlights', data)
+
+    def test_list_leaves_out_highlights(self):
+        data = DocumentListSerializer(self.document, context=self.context).data
+        self.assertNotIn('highlights', data)
+        self.assertNotIn('_highlights', data)
+
+
+class CorpusVersionTests(TestCase):
+    """The counter moves only once the insert or delete is committed."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='owner@x.com', email='owner@x.com', password='pw')
+
+    def test_insert_is_stamped_after_commit(self):
+        before, _ = CorpusVersion.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            doc = make_document(self.user, PASSAGE)
+            self.assertEqual(CorpusVersion.current()[0], before)
+        doc.refresh_from_db()
+        self.assertEqual(doc.version, before + 1)
+        self.assertEqual(CorpusVersion.current()[0], before + 1)
+
+    def test_delete_records_last_delete_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            doc = make_document(self.user, PASSAGE)
+        with self.captureOnCommitCallbacks(execute=True):
+            doc.delete()
+            self.assertEqual(CorpusVersion.current(), (doc.version, 0))
+        self.assertEqual(CorpusVersion.current(), (doc.version + 1, doc.version + 1))
+
+
+class StratifiedOrderTests(SimpleTestCase):
+    """The adaptive sample depends on each chunk's content, not on the rest of the text."""
+
+    def setUp(self):
+        self.names = [f'chunk {i}' for i in range(300)]
+        self.order = stratified_order(chunk_keys(self.names), 8)
+
+    def test_every_chunk_once_and_each_round_spans_the_document(self):
+        self.assertEqual(sorted(self.order), list(range(300)))
+        first = sorted(self.order[:8])
+        self.assertEqual([i * 300 // 8 <= j < (i + 1) * 300 // 8 for i, j in enumerate(first)], [True] * 8)
+
+    def test_sample_survives_an_edit(self):
+        names = list(self.names)
+        names[150] = 'rewritten chunk'
+        edited = stratified_order(chunk_keys(names), 8)
+        self.assertGreaterEqual(len(set(self.order[:64]) & set(edited[:64])), 63)
+
+    def test_sample_survives_an_insert(self):
+        names = self.names[:150] + ['inserted chunk'] + self.names[150:]
+        edited = stratified_order(chunk_keys(names), 8)
+        sampled = {self.names[i] for i in self.order[:64]}
+        self.assertGreaterEqual(len(sampled & {names[i] for i in edited[:64]}), 60)
+
+
+class SuffixAutomatonTests(SimpleTestCase):
+    """Exact alignment finds a copied passage at every place it occurs in the upload."""
+
+    source = 'thequickbrownfoxjumpsoverthelazydogwhilethecatsleeps'
+
+    def test_repeated_passage_is_found_twice(self):
+        upload = 'x' * 50 + self.source + 'y' * 300 + self.source + 'z' * 10
+        spans = SuffixAutomaton(self.source).common_substrings(upload, 20)
+        self.assertEqual(spans, [(50, 50 + len(self.source)), (350 + len(self.source), 350 + 2 * len(self.source))])
+
+    def test_partial_repeat_and_min_length(self):
+        upload = self.source + '.' * 10 + self.source[10:40] + '.' * 10 + self.source[:15]
+        spans = SuffixAutomaton(self.source).common_substrings(upload, 20)
+        start = len(self.source) + 10
+        self.assertEqual(spans, [(0, len(self.source)), (start, start + 30)])
+
+    def test_merge_spans_joins_touching_spans(self):
+        self.assertEqual(merge_spans([(5, 9), (0, 3), (3, 4), (8, 12)]), [(0, 4), (5, 12)])
+
+
+def random_text(rng, words):
+    return ' '.join(''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9))) for _ in range(words))
+
+
+@override_settings(WINNOWING_NOISE_THRESHOLD=25, WINNOWING_GUARANTEE_THRESHOLD=60)
+class WinnowingTests(SimpleTestCase):
+    """Fingerprints keep the guarantee and noise thresholds and point into the original text."""
+
+    def setUp(self):
+        self.rng = random.Random(2)
+
+    def shared(self, a, b):
+        return {h for h, _, _ in fingerprints(a)} & {h for h, _, _ in fingerprints(b)}
+
+    def test_rolling_hash_matches_direct_hash(self):
+        text = 'abcdefghijabcdefghij'
+        direct = kgram_hashes(text, 5)
+        self.assertEqual(len(direct), len(text) - 4)
+        for i in range(len(direct)):
+            self.assertEqual(direct[i], kgram_hashes(text[i:i + 5], 5)[0])
+        self.assertEqual(direct[0], direct[10])
+
+    def test_winnow_selects_every_window_minimum(self):
+        hashes = [self.rng.randrange(1000) for _ in range(200)]
+        selected = {i for _, i in winnow(hashes, 8)}
+        for start in range(len(hashes) - 7):
+            window = range(start, start + 8)
+            self.assertTrue(selected & set(window))
+            self.assertIn(min(hashes[i] for i in window), {hashes[i] for i in selected & set(window)})
+
+    def test_passage_at_guarantee_threshold_is_always_found(self):
+        for _ in range(20):
+            passage = random_text(self.rng, 40)
+            norm, offsets = alnum_chars(passage)
+            # exactly 60 normalized characters, cut at a random place
+            start = self.rng.randrange(len(norm) - 60)
+            piece = passage[offsets[start]:offsets[start + 59] + 1]
+            a = random_text(self.rng, 30) + ' ' + piece + ' ' + random_text(self.rng, 30)
+            b = random_text(self.rng, 20) + ' ' + piece + ' ' + random_text(self.rng, 20)
+            self.assertTrue(self.shared(a, b))
+
+    def test_passage_under_noise_threshold_is_ignored(self):
+        piece = 'sharedbitsxyz'
+        a = random_text(self.rng, 40) + ' ' + piece + ' ' + random_text(self.rng, 40)
+        b = random_text(self.rng, 40) + ' ' + piece + ' ' + random_text(self.rng, 40)
+        self.assertFalse(self.shared(a, b))
+
+    def test_offsets_refer_to_the_original_text(self):
+        text = 'Hello, World!  ' * 10
+        for _, start, end in fingerprints(text):
+            norm, _ = alnum_chars(text[start:end])
+            self.assertEqual(len(norm), 25)
+            self.assertTrue(text[start].isalnum() and text[end - 1].isalnum())
+
+
+@override_settings(MINHASH_PERMUTATIONS=128, MINHASH_SHINGLE_SIZE=9, LSH_BANDS=64)
+class MinHashTests(SimpleTestCase):
+    """Signatures estimate Jaccard similarity and LSH bands bring near duplicates together."""
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.text = random_text(rng, 400)
+        self.unrelated = random_text(rng, 400)
+        words = self.text.split()
+        self.half = ' '.join(words[:200] + random_text(rng, 200).split())
+
+    def test_signature_shape_and_determinism(self):
+        sig = signature(self.text)
+        self.assertEqual(sig.dtype, 'uint32')
+        self.assertEqual(len(sig), 128)
+        self.assertTrue((sig == signature(self.text)).all())
+
+    def test_signature_estimates_jaccard(self):
+        a = document_grams(self.text, n=9)
+        b = document_grams(self.half, n=9)
+        jaccard = len(a & b) / len(a | b)
+        estimate = float((signature(self.text) == signature(self.half)).mean())
+        self.assertAlmostEqual(estimate, jaccard, delta=0.12)
+        self.assertLess(float((signature(self.text) == signature(self.unrelated)).mean()), 0.05)
+
+    def test_bands_collide_for_near_duplicates_only(self):
+        buckets = set(band_buckets(signature(self.text)))
+        self.assertEqual(len(buckets), 64)
+        near = self.text.replace(self.text.split()[100], 'changed', 1)
+        self.assertTrue(buckets & set(band_buckets(signature(near))))
+        self.assertFalse(buckets & set(band_buckets(signature(self.unrelated))))
+
+
+class WordTokenizer:
+    """Stands in for a Hugging Face tokenizer: one token per word."""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False, verbose=True):
+        return {'offset_mapping': [m.span() for m in re.finditer(r'\S+', text)]}
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+
+@override_settings(AI_DETECTOR_MAX_LENGTH=42, AI_DETECTOR_STRIDE=8, AI_CHUNK_ANCHOR_EVERY=4)
+class TokenChunksTests(SimpleTestCase):
+    """Token windows stay within the model's length, cover the text and follow its content."""
+
+    def setUp(self):
+        rng = random.Random(4)
+        self.lines = [random_text(rng, rng.randint(3, 15)) for _ in range(120)]
+        self.text = '\n'.join(self.lines)
+
+    def chunks(self, text):
+        return [text[start:end] for start, end in token_chunks(WordTokenizer(), text)]
+
+    def test_windows_fit_and_cover_the_text(self):
+        spans = token_chunks(WordTokenizer(), self.text)
+        covered = set()
+        for start, end in spans:
+            self.assertLessEqual(len(self.text[start:end].split()), 40)
+            covered.update(range(start, end))
+        self.assertTrue(all(i in covered for i, ch in enumerate(self.text) if not ch.isspace()))
+
+    def test_long_line_is_split(self):
+        line = ' '.join(f'w{i}' for i in range(100))
+        self.assertTrue(all(len(chunk.split()) <= 40 for chunk in self.chunks(line)))
+
+    def test_an_insert_only_changes_the_windows_around_it(self):
+        lines = list(self.lines)
+        lines[60:60] = ['a new line inserted into the draft by its author']
+        before = self.chunks(self.text)
+        after = self.chunks('\n'.join(lines))
+        self.assertLessEqual(len(set(after) - set(before)), 3)
+
+    def test_empty_text(self):
+        self.assertEqual(token_chunks(WordTokenizer(), ''), [])
+
+
+class RevisionDiffTests(SimpleTestCase):
+    """Highlights of a draft move with the unchanged lines of its revision."""
+
+    def setUp(self):
+        self.old_lines = [f'line {i} of the first draft\n' for i in range(40)]
+        self.old = ''.join(self.old_lines)
+        new_lines = list(self.old_lines)
+        new_lines[10] = 'a rewritten line\n'
+        new_lines[30:30] = ['an inserted line\n', 'and another one\n']
+        self.new = ''.join(new_lines)
+        self.blocks = unchanged_blocks(self.old, self.new)
+
+    def test_unchanged_blocks_are_identical_text(self):
+        for old_start, new_start, size in self.blocks:
+            self.assertEqual(self.old[old_start:old_start + size], self.new[new_start:new_start + size])
+        self.assertEqual(sum(size for _, _, size in self.blocks), len(self.old) - len(self.old_lines[10]))
+
+    def test_changed_regions_cover_the_edits_with_context(self):
+        regions = changed_regions(self.blocks, len(self.old), len(self.new), context=10)
+        self.assertEqual(len(regions), 2)
+        for text in ('a rewritten line', 'an inserted line\nand another one'):
+            start = self.new.index(text)
+            self.assertTrue(any(s <= start - 10 and start + len(text) + 10 <= e for s, e in regions))
+        self.assertEqual(changed_regions(unchanged_blocks(self.old, self.old), len(self.old), len(self.old)), [])
+
+    def test_split_span_maps_joined_regions_back(self):
+        regions = [(5, 15), (40, 50)]
+        joined = join_regions(self.new, regions)
+        self.assertEqual(joined, self.new[5:15] + '\n' + self.new[40:50])
+        self.assertEqual(split_span(regions, 8, 14), [(13, 15), (40, 43)])
+
+    def test_carry_over_moves_clips_and_drops_highlights(self):
+        def highlight(text, line):
+            start = text.index(line)
+            return {'type': 'plagiarism', 'start': start, 'end': start + len(line), 'source': 1}
+        after = highlight(self.old, 'line 35 of the first draft')
+        across = {**highlight(self.old, 'line 9 of the first draft'), 'end': self.old.index('line 11')}
+        regions = changed_regions(self.blocks, len(self.old), len(self.new), context=0)
+        moved = carry_over([after, across], self.blocks, self.new, regions)
+        spans = [self.new[h['start']:h['end']] for h in moved]
+        # shifted past the insert; clipped to the unchanged line before the rewrite
+        self.assertEqual(spans, ['line 35 of the first draft', 'line 9 of the first draft\n'])
+        self.assertTrue(all(h['source'] == 1 and 'position' in h for h in moved))
+
+
+@override_settings(TEXT_CASEFOLD=False, TEXT_STRIP_BOILERPLATE=True, TEXT_STRIP_REFERENCES=True)
+class NormalizeTests(SimpleTestCase):
+    """Canonical text is the same across extractions, and its offsets lead back to the original."""
+
+    def pages(self, pdf):
+        paragraphs = [
+            f"Trial {i} of the experi-\nment no. {i} measured the e\ufb00ect of tem-\nperature in {i + 2}  cultures."
+            for i in range(9)
+        ]
+        if not pdf:
+            text = ' '.join(p.replace('-\n', '').replace('\ufb00', 'ff').replace('  ', ' ').replace('\n', ' ') for p in paragraphs)
+            return text + '\n\nReferences\n[1] A. Author.'
+        pages = [' '.join(paragraphs[i:i + 3]) for i in range(0, 9, 3)]
+        return ''.join(f"Journal of Things\n{page}\n{n + 1}\n" for n, page in enumerate(pages)) + 'References\n[1] A. Author.\n'
+
+    def test_pdf_and_docx_extractions_agree(self):
+        self.assertEqual(canonical_text(self.pages(pdf=True))[0], canonical_text(self.pages(pdf=False))[0])
+        self.assertEqual(calculate_content_hash(self.pages(pdf=True)), calculate_content_hash(self.pages(pdf=False)))
+
+    def test_offsets_lead_back_to_the_original(self):
+        text = 'Caf\u00e9 \ufb01ne  exam-\nple\u00adword   Ｆｕｌｌ\twidth'
+        normalized, offsets = normalize(text)
+        self.assertEqual(normalized, 'Café fine exampleword Full width')
+        self.assertEqual(len(offsets), len(normalized))
+        self.assertEqual(offsets, sorted(offsets))
+        start = normalized.index('exampleword')
+        self.assertEqual(text[slice(*original_span(offsets, start, start + len('exampleword')))], 'exam-\nple\u00adword')
+        start = normalized.index('Full')
+        self.assertEqual(text[slice(*original_span(offsets, start, start + 4))], 'Ｆｕｌｌ')
+
+    def test_combining_marks_and_case_folding(self):
+        normalized, offsets = normalize('Cafe\u0301 STRASSE', casefold=True)
+        self.assertEqual(normalized, 'caf\u00e9 strasse')
+        self.assertEqual(offsets[3], 3)
+
+    def test_model_text_keeps_case_and_line_breaks(self):
+        text = 'First Line here\nSecond  Line'
+        self.assertEqual(model_text(text)[0], 'First Line here\nSecond Line')
+        self.assertEqual(canonical_text(text)[0], 'First Line here Second Line')
+
+    def test_references_only_dropped_in_the_second_half(self):
+        early = 'References\n' + 'Body sentence of the essay. ' * 20
+        self.assertIn('References', canonical_text(early)[0])
+        late = 'Body sentence of the essay. ' * 20 + '\nReferences\n[1] Someone.'
+        self.assertNotIn('Someone', canonical_text(late)[0])
+
+    def test_migration_copy_matches(self):
+        migration = importlib.import_module('documents.migrations.0016_canonical_content_hash')
+        rng = random.Random(5)
+        bits = ['exam-\nple', '  ', '\n', '\t', '\ufb01', 'e\u0301', '\u00ad', 'Ｆ', 'x', 'Page 3\n', '12\n',
+                'Header line\n', '\nReferences\n', '[1] A.', 'word ', 'A. ', '\u00bd', '\r\n']
+        for _ in range(500):
+            text = ''.join(rng.choice(bits) for _ in range(rng.randint(0, 60)))
+            self.assertEqual(migration.canonical_text(text), canonical_text(text)[0])
+
+
+@override_settings(AI_SAMPLING_MIN_CHUNKS=16, AI_SAMPLING_MAX_CHUNKS=64, AI_SAMPLING_TOLERANCE=10)
+class ConfidenceIntervalTests(SimpleTestCase):
+    """The adaptive scan stops once its interval is tight, and the interval covers the full score."""
+
+    def test_degenerate_samples(self):
+        self.assertEqual(confidence_interval([], 10), (0.0, 100.0))
+        self.assertEqual(confidence_interval([40.0], 10), (0.0, 100.0))
+        self.assertEqual(confidence_interval([40.0, 60.0], 2), (50.0, 50.0))
+
+    def test_interval_narrows_and_covers_the_mean(self):
+        rng = random.Random(6)
+        scores = [rng.choice([5.0, 95.0]) if rng.random() < 0.5 else rng.uniform(0, 100) for _ in range(500)]
+        mean = sum(scores) / len(scores)
+        order = stratified_order(chunk_keys(f'chunk {i}' for i in range(500)), 8)
+        widths = []
+        for k in (16, 64, 256):
+            low, high = confidence_interval([scores[i] for i in order[:k]], len(scores))
+            self.assertLessEqual(low, mean)
+            self.assertGreaterEqual(high, mean)
+            widths.append(high - low)
+        self.assertEqual(widths, sorted(widths, reverse=True))
+
+    def test_settled(self):
+        self.assertFalse(settled([50.0] * 15, 1000))
+        self.assertTrue(settled([50.0] * 16, 1000))
+        self.assertFalse(settled([0.0, 100.0] * 8, 1000))
+        self.assertTrue(settled([0.0, 100.0] * 32, 1000))
+        self.assertTrue(settled([0.0, 100.0], 2))
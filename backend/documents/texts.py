@@ -0,0 +1,29 @@
+# documents/texts.py
+from .models import DocumentText
+from .normalize import canonical_text
+
+# keep well under SQLite's bound-parameter limit
+QUERY_BATCH = 900
+
+
+def iter_document_texts(ids=None, chunk_size=100):
+    """
+    Yield (document id, canonical text) for the documents in ids (all of
+    them if None), streamed from DocumentText chunk_size rows at a time and
+    decompressed and normalized one by one.
+    """
+    if ids is None:
+        rows = DocumentText.objects.values_list('document_id', 'data')
+        for pk, data in rows.iterator(chunk_size=chunk_size):
+            yield pk, canonical_text(DocumentText.unpack(data))[0]
+        return
+
+    ids = list(ids)
+    for i in range(0, len(ids), QUERY_BATCH):
+        rows = (
+            DocumentText.objects
+            .filter(document_id__in=ids[i:i + QUERY_BATCH])
+            .values_list('document_id', 'data')
+        )
+        for pk, data in rows.iterator(chunk_size=chunk_size):
+            yield pk, canonical_text(DocumentText.unpack(data))[0]
@@ -1,7 +1,7 @@
 # documents/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AnalyzeDocumentView, DocumentViewSet
+from .views import AnalyzeDocumentView, AnalyzeBatchView, AnalyzeDocumentStreamView, AnalysisJobView, AnalysisJobDetailView, DocumentViewSet
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -14,5 +14,9 @@ urlpatterns = [
     path('', include(router.urls)),
     
     path('analyze/', AnalyzeDocumentView.as_view(), name='analyze-document'),
+    path('analyze/batch/', AnalyzeBatchView.as_view(), name='analyze-batch'),
+    path('analyze/stream/', AnalyzeDocumentStreamView.as_view(), name='analyze-document-stream'),
+    path('analyze/jobs/', AnalysisJobView.as_view(), name='analysis-jobs'),
+    path('analyze/jobs/<int:pk>/', AnalysisJobDetailView.as_view(), name='analysis-job-detail'),
     
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
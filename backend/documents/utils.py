@@ -1,31 +1,44 @@
 import PyPDF2
 import docx
+import io
 import re
-import textstat
-import torch
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import bisect
+import zlib
+import numpy as np
 from .models import Document
+from .index import find_candidate_documents
+from .winnowing import matched_spans
+from .alignment import aligned_spans, merge_spans
+from .ai_cache import cached_predictions, chunk_hash
+from .texts import iter_document_texts
+from .streaming import streamed_spans
+from .sampling import confidence_interval, settled, stratified_order
+from .normalize import canonical_text, model_text, original_span
+from .pools import process_pool
+from django.conf import settings
 import logging
-from transformers import pipeline
+from .detectors import get_detector
 
 logger = logging.getLogger(__name__)
 
-def extract_text_from_file(file):
-    """Extract text with better error handling."""
+def extract_text_from_file(file, parallel=True):
+    """
+    Extract text with better error handling.
+    parallel=False keeps PDF extraction in this process (for callers
+    already running in a worker process).
+    """
     text = ""
     logger.info(f"Starting extraction for {file.name}")
     if file.name.lower().endswith('.pdf'):
         try:
-            file.seek(0)
-            reader = PyPDF2.PdfReader(file)
-            if not reader.pages:
-                raise ValueError("PDF has no readable pages")
-            for i, page in enumerate(reader.pages[:20]):
-                chunk = page.extract_text() or ''
-                text += chunk + "\n"
-                if i >= 3 and len(text) < 100:
+            pages = []
+            length = 0
+            for i, chunk in enumerate(iter_pdf_pages(file, parallel=parallel)):
+                pages.append(chunk)
+                length += len(chunk) + 1
+                if i >= 3 and length < 100:
                     raise ValueError("PDF looks image-based")
+            text = "\n".join(pages)
             if len(text.strip()) < 100:
                 raise ValueError("PDF contains insufficient text")
         except Exception as e:
@@ -50,81 +63,459 @@ def extract_text_from_file(file):
     return text.strip()
 
 
-def analyze_text(content_hash, text):
+def extract_text_from_bytes(name, data, parallel=True):
+    """extract_text_from_file for raw upload bytes (picklable, for worker processes)."""
+    file = io.BytesIO(data)
+    file.name = name
+    return extract_text_from_file(file, parallel=parallel)
+
+
+# pages per process pool task
+PDF_PAGES_PER_TASK = 8
+
+
+def iter_pdf_pages(file, parallel=True):
+    """
+    Yield the text of each page of a PDF, in order, up to PDF_MAX_PAGES.
+    From PDF_PARALLEL_MIN_PAGES pages on (and with parallel), page ranges
+    are extracted by the shared pool of PDF_EXTRACTION_WORKERS processes and
+    yielded in order.
+    """
+    file.seek(0)
+    reader = PyPDF2.PdfReader(file)
+    count = len(reader.pages)
+    if not count:
+        raise ValueError("PDF has no readable pages")
+    if settings.PDF_MAX_PAGES and count > settings.PDF_MAX_PAGES:
+        logger.warning(f"{file.name}: only the first {settings.PDF_MAX_PAGES} of {count} pages are analyzed")
+        count = settings.PDF_MAX_PAGES
+
+    workers = min(settings.PDF_EXTRACTION_WORKERS, count // PDF_PAGES_PER_TASK)
+    if not parallel or count < settings.PDF_PARALLEL_MIN_PAGES or workers <= 1:
+        for i in range(count):
+            yield reader.pages[i].extract_text() or ''
+        return
+
+    file.seek(0)
+    data = file.read()
+    pool = process_pool('pdf', settings.PDF_EXTRACTION_WORKERS)
+    futures = [
+        pool.submit(_pdf_page_range, data, start, min(start + PDF_PAGES_PER_TASK, count))
+        for start in range(0, count, PDF_PAGES_PER_TASK)
+    ]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        # the caller may stop early (e.g. an image-based PDF); the pool is shared
+        for future in futures:
+            future.cancel()
+
+
+def _pdf_page_range(data, start, stop):
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    return [reader.pages[i].extract_text() or '' for i in range(start, stop)]
+
+
+def notify(progress, event, **data):
+    """Send a progress event to the optional progress(event, data) callback."""
+    if progress:
+        progress(event, data)
+
+
+def partial_score(spans, total):
+    """Percentage of total covered by the union of (start, end) spans."""
+    matched = sum(end - start for start, end in merge_spans(spans))
+    return min(round(matched / total * 100, 1), 100.0) if total else 0.0
+
+
+def analyze_text(content_hash, text, progress=None, candidate_ids=None, exclude_ids=()):
     """
     Plagiarism detection via character 5-gram sliding windows
-    against all other docs (excluding the one with this hash).
+    against the indexed docs sharing n-grams with text
+    (excluding the one with this hash and exclude_ids), or
+    against candidate_ids.
+    With PLAGIARISM_MODE = 'winnowing' matches come from fingerprint
+    intersection instead, with 'alignment' from exact common
+    substrings with the candidates, and with 'streaming' from a
+    bounded-memory scan of the whole corpus.
+    Detection runs on canonical_text(text); highlights and the score
+    refer to text itself.
+    progress(event, data) receives 'candidates' and per-batch
+    'plagiarism' events with the partial score and new highlights.
     """
-    # fetch all other documents' contents
-    others = list(
-        Document.objects
-        .exclude(content_hash=content_hash)
-        .values_list('content', flat=True)
+    canonical, offsets = canonical_text(text)
+    result = analyze_canonical(
+        content_hash, canonical,
+        progress=restored_progress(progress, text, offsets),
+        candidate_ids=candidate_ids,
+        exclude_ids=exclude_ids
     )
+    return restore_result(result, text, offsets)
+
+
+def restore_highlights(highlights, text, offsets):
+    """Highlights found in a normalized form of text, moved to text's own offsets."""
+    restored = []
+    for h in highlights:
+        start, end = original_span(offsets, h['start'], h['end'])
+        restored.append({**h, 'position': calculate_position(text, start, end), 'start': start, 'end': end})
+    return restored
+
+
+def restore_result(result, text, offsets):
+    """A detector result on a normalized form of text, with highlights and score for text."""
+    highlights = restore_highlights(result['highlights'], text, offsets)
+    return {
+        **result,
+        'score': partial_score([(h['start'], h['end']) for h in highlights], len(text)),
+        'highlights': highlights
+    }
+
+
+def restored_progress(progress, text, offsets):
+    """progress, with the highlights of each event moved back to text's offsets."""
+    if not progress:
+        return None
+
+    def restored(event, data):
+        if data.get('highlights'):
+            data = {**data, 'highlights': restore_highlights(data['highlights'], text, offsets)}
+        progress(event, data)
+    return restored
+
+
+def analyze_canonical(content_hash, text, progress=None, candidate_ids=None, exclude_ids=()):
+    """analyze_text() for text already in canonical form."""
+    if settings.PLAGIARISM_MODE == 'winnowing':
+        result = analyze_fingerprints(content_hash, text, documents=candidate_ids, exclude_ids=exclude_ids)
+        notify(progress, 'plagiarism', done=1, total=1, **result)
+        return result
+    if settings.PLAGIARISM_MODE == 'streaming':
+        return analyze_streaming(content_hash, text, candidate_ids, progress=progress, exclude_ids=exclude_ids)
+
+    # fetch only the candidates the pre-filter turns up
+    if candidate_ids is None:
+        candidate_ids = [
+            pk for pk in find_candidate_documents(text, exclude_hash=content_hash)
+            if pk not in exclude_ids
+        ]
+    notify(progress, 'candidates', count=len(candidate_ids))
+    if settings.PLAGIARISM_MODE == 'alignment':
+        return analyze_alignment(text, candidate_ids, progress=progress)
+
+    others = [content for _, content in iter_document_texts(candidate_ids)]
     if not others:
         return {'score': 0.0, 'highlights': []}
 
+    # scikit-learn is imported on first use, not with the module
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
     # vectorize full text + others
     vec = TfidfVectorizer(analyzer='char', ngram_range=(5, 5))
     corpus = [text] + others
     mat = vec.fit_transform(corpus)
-    base_vec = mat[0]
+    others_mat = mat[1:]
 
     window = 200
     step = 100
     total = len(text)
-    matched = set()
-    highlights = []
+    starts = list(range(0, total - window + 1, step))
+    if not starts:
+        return {'score': 0.0, 'highlights': []}
 
-    for start in range(0, total - window + 1, step):
-        snippet = text[start:start + window]
-        sim = cosine_similarity(vec.transform([snippet]), mat[1:])[0]
-        # find any doc with similarity > threshold
-        if sim.max() > 0.3:
-            end = start + window
-            # mark chars
-            matched.update(range(start, end))
-            highlights.append({
+    # all windows in one transform, scored against the corpus in row chunks
+    # so the dense-ish similarity block stays bounded
+    windows = vec.transform([text[start:start + window] for start in starts])
+    batch = settings.PLAGIARISM_WINDOW_BATCH
+    spans = []
+    highlights = []
+    for i in range(0, len(starts), batch):
+        sim = cosine_similarity(windows[i:i + batch], others_mat, dense_output=False)
+        best = sim.max(axis=1).toarray().ravel()
+        # find any window with similarity > threshold against some doc
+        new = [(start, start + window) for start, s in zip(starts[i:i + batch], best) if s > 0.3]
+        spans.extend(new)
+        new_highlights = [
+            {
                 'type': 'plagiarism',
-                'position': calculate_position(text, start, end)
-            })
+                'position': calculate_position(text, start, end),
+                'start': start,
+                'end': end
+            }
+            for start, end in new
+        ]
+        highlights.extend(new_highlights)
+        if progress:
+            notify(
+                progress, 'plagiarism',
+                done=min(i + batch, len(starts)), total=len(starts),
+                score=partial_score(spans, total), highlights=new_highlights
+            )
 
-    score = round(len(matched) / total * 100, 1) if total else 0.0
+    return {
+        'score': partial_score(spans, total),
+        'highlights': highlights
+    }
+
+
+def analyze_batch(texts, hashes, exclude_ids=None):
+    """
+    Plagiarism detection for several texts: each is checked against the
+    corpus as analyze_text would (in PLAGIARISM_MODE, bar the documents
+    with its own hash and its exclude_ids entry), and one TF-IDF
+    vectorization of their canonical forms gives the pairwise cosine
+    similarity (in percent) of the texts. Returns the per-text results and
+    that matrix.
+    """
+    exclude_ids = exclude_ids or [()] * len(texts)
+    normalized = [canonical_text(text) for text in texts]
+    results = [
+        restore_result(analyze_canonical(content_hash, canonical, exclude_ids=excluded), text, offsets)
+        for text, content_hash, (canonical, offsets), excluded in zip(texts, hashes, normalized, exclude_ids)
+    ]
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    vec = TfidfVectorizer(analyzer='char', ngram_range=(5, 5))
+    similarity = np.round(cosine_similarity(vec.fit_transform([canonical for canonical, _ in normalized])) * 100, 1)
+    return results, similarity.tolist()
+
+
+def alignment_highlight(text, start, end, source):
+    return {
+        'type': 'plagiarism',
+        'position': calculate_position(text, start, end),
+        'start': start,
+        'end': end,
+        'source': source
+    }
+
+
+def analyze_alignment(text, candidate_ids, progress=None):
+    """Plagiarism detection via maximal common substrings with the candidates."""
+    total = len(text)
+    seen = []
+
+    def on_candidate(done, count, spans):
+        seen.extend((start, end) for start, end, _ in spans)
+        notify(
+            progress, 'plagiarism',
+            done=done, total=count, score=partial_score(seen, total),
+            highlights=[alignment_highlight(text, *span) for span in spans]
+        )
+
+    spans = aligned_spans(text, candidate_ids, progress=on_candidate if progress else None)
+    return {
+        'score': partial_score([(start, end) for start, end, _ in spans], total),
+        'highlights': [alignment_highlight(text, *span) for span in spans]
+    }
+
+
+def analyze_streaming(content_hash, text, candidate_ids=None, progress=None, exclude_ids=()):
+    """Plagiarism detection via hashed 5-gram windows, streaming the corpus (see streaming.py)."""
+    total = len(text)
+
+    def on_chunk(done, count, spans):
+        notify(progress, 'plagiarism', done=done, total=count, score=partial_score(spans, total), highlights=[])
+
+    spans = streamed_spans(
+        text,
+        exclude_hash=content_hash,
+        candidate_ids=candidate_ids,
+        exclude_ids=exclude_ids,
+        progress=on_chunk if progress else None
+    )
+    return {
+        'score': partial_score([(start, end) for start, end, _ in spans], total),
+        'highlights': [alignment_highlight(text, *span) for span in spans]
+    }
+
+
+def analyze_fingerprints(content_hash, text, documents=None, exclude_ids=()):
+    """Plagiarism detection via winnowed fingerprints shared with other docs."""
+    total = len(text)
+    spans = merge_spans(matched_spans(text, exclude_hash=content_hash, documents=documents, exclude_ids=exclude_ids))
+    highlights = [
+        {
+            'type': 'plagiarism',
+            'position': calculate_position(text, start, end),
+            'start': start,
+            'end': end
+        }
+        for start, end in spans
+    ]
+    matched = sum(end - start for start, end in spans)
+    score = round(matched / total * 100, 1) if total else 0.0
     return {
         'score': min(score, 100.0),
         'highlights': highlights
     }
 
 
-def check_ai_probability(text, plagiarism_highlights=None, plagiarism_score=0):
+def check_ai_probability(text, plagiarism_highlights=None, plagiarism_score=0, progress=None, scan=None):
     """
-    AI detection: simple chunking, no overlap.
+    AI detection: token windows filled up to the model limit (see
+    token_chunks), scored in batches of AI_DETECTOR_BATCH_SIZE, with
+    per-chunk results cached across documents. scan is 'full' (every
+    chunk) or 'adaptive' (a stratified sample, see sampling.py) and
+    defaults to AI_SCAN_MODE; 'confidence' gives the interval of the
+    score and how many chunks were scored. The model reads
+    model_text(text); highlights refer to text itself.
+    progress(event, data) receives an 'ai' event per batch with the
+    partial (uncapped) score and new highlights.
     """
     plagiarism_score = plagiarism_score or 0
+    original = text
+    text, offsets = model_text(original)
     if len(text) < 300:
-        return {'score': 0.0, 'highlights': []}
+        return {'score': 0.0, 'highlights': [], 'confidence': ChunkScan(text, []).confidence()}
+
+    # loaded once per process, on the configured backend
+    detector = get_detector()
+
+    state = ChunkScan(text, token_chunks(detector.tokenizer, text), adaptive=(scan or settings.AI_SCAN_MODE) == 'adaptive')
+    predict = batched_predict(detector)
+
+    # only chunks never seen before by this model go through inference;
+    # adaptive scans and progress callbacks go one batch at a time
+    group = settings.AI_DETECTOR_BATCH_SIZE if progress or state.adaptive else max(len(state.spans), 1)
+    while not state.finished():
+        indices = state.next(group)
+        results = cached_predictions(detector.name, [state.chunk(i) for i in indices], predict)
+        new_highlights = state.add(indices, results)
+        notify(
+            progress, 'ai',
+            done=len(state.scores), total=len(state.spans),
+            score=state.score(), highlights=restore_highlights(new_highlights, original, offsets)
+        )
 
-    # initialize once
-    if not hasattr(check_ai_probability, 'detector'):
-        check_ai_probability.detector = pipeline(
-            'text-classification',
-            model='Hello-SimpleAI/chatgpt-detector-roberta',
-            truncation=True,
-            max_length=512,
-            device= 0 if torch.cuda.is_available() else -1
+    # caping so that plagiarism + ai ≤ 100
+    cap = max(0.0, 100.0 - plagiarism_score)
+    return {
+        'score': min(state.score(), cap),
+        'highlights': restore_highlights(state.sorted_highlights(), original, offsets),
+        'confidence': state.confidence()
+    }
+
+
+def check_ai_probability_batch(texts, scan=None):
+    """
+    AI detection for several texts in one pass: the token windows of all
+    texts go through cached_predictions (and the model) together, a round
+    of AI_DETECTOR_BATCH_SIZE per text at a time for adaptive scans.
+    Scores are uncapped.
+    """
+    detector = get_detector()
+    adaptive = (scan or settings.AI_SCAN_MODE) == 'adaptive'
+    normalized = [model_text(text) for text in texts]
+    states = [
+        ChunkScan(text, token_chunks(detector.tokenizer, text) if len(text) >= 300 else [], adaptive=adaptive)
+        for text, _ in normalized
+    ]
+    predict = batched_predict(detector)
+    while True:
+        picks = [
+            (state, state.next(settings.AI_DETECTOR_BATCH_SIZE if adaptive else len(state.spans)))
+            for state in states if not state.finished()
+        ]
+        if not picks:
+            break
+        chunks = [state.chunk(i) for state, indices in picks for i in indices]
+        results = cached_predictions(detector.name, chunks, predict)
+        offset = 0
+        for state, indices in picks:
+            state.add(indices, results[offset:offset + len(indices)])
+            offset += len(indices)
+
+    return [
+        {
+            'score': state.score(),
+            'highlights': restore_highlights(state.sorted_highlights(), original, offsets),
+            'confidence': state.confidence()
+        }
+        for state, original, (_, offsets) in zip(states, texts, normalized)
+    ]
+
+
+class ChunkScan:
+    """
+    The AI scan of one text: its chunk spans, the order to score them in
+    (stratified for adaptive scans) and the scores and highlights so far.
+    """
+
+    def __init__(self, text, spans, adaptive=False):
+        self.text = text
+        self.spans = spans
+        self.adaptive = adaptive
+        if adaptive:
+            keys = [chunk_hash(text[start:end]) for start, end in spans]
+            self.order = stratified_order(keys, settings.AI_DETECTOR_BATCH_SIZE)
+        else:
+            self.order = list(range(len(spans)))
+        self.scores = []
+        self.highlights = []
+
+    def chunk(self, i):
+        start, end = self.spans[i]
+        return self.text[start:end]
+
+    def next(self, size):
+        """Indices of the next (up to) size chunks to score."""
+        return self.order[len(self.scores):len(self.scores) + size]
+
+    def add(self, indices, results):
+        """Record the predictions of chunks indices and return their new highlights."""
+        scores, highlights = score_chunks(self.text, [self.spans[i] for i in indices], results)
+        self.scores.extend(scores)
+        self.highlights.extend(highlights)
+        return highlights
+
+    def finished(self):
+        if self.adaptive:
+            return settled(self.scores, len(self.spans))
+        return len(self.scores) >= len(self.spans)
+
+    def score(self):
+        return round(sum(self.scores) / len(self.scores), 1) if self.scores else 0.0
+
+    def sorted_highlights(self):
+        return sorted(self.highlights, key=lambda h: h['start'])
+
+    def confidence(self):
+        """Interval of the document score (uncapped) and the chunks it rests on."""
+        low, high = confidence_interval(self.scores, len(self.spans)) if self.spans else (0.0, 0.0)
+        return {
+            'low': round(low, 1),
+            'high': round(high, 1),
+            'sampled': len(self.scores),
+            'total': len(self.spans)
+        }
+
+
+def batched_predict(detector):
+    """predict(chunks) for cached_predictions: one batched detector call."""
+    def predict(batch):
+        # longest first so each batch pads to similar lengths
+        order = sorted(range(len(batch)), key=lambda j: len(batch[j]), reverse=True)
+        results = detector(
+            [batch[j] for j in order],
+            batch_size=settings.AI_DETECTOR_BATCH_SIZE
         )
+        out = [None] * len(batch)
+        for j, res in zip(order, results):
+            out[j] = res
+        return out
+    return predict
 
-    chunk_size = 512
-    preds = []
-    for i in range(0, len(text), chunk_size):
-        chunk = text[i:i+chunk_size]
-        if len(chunk) < 100:
-            continue
-        preds.append((i, check_ai_probability.detector(chunk)[0]))
 
+def score_chunks(text, spans, results):
+    """Per-chunk AI percentages and highlights for the predictions of spans."""
     scores = []
     highlights = []
-    for idx, pred in preds:
+    for (start, end), pred in zip(spans, results):
         lbl = pred['label']
         sc = pred['score'] * 100
         # if label is AI, we take sc; if HUMAN, we take (100 - sc)
@@ -133,16 +524,74 @@ def check_ai_probability(text, plagiarism_highlights=None, plagiarism_score=0):
         if lbl == 'AI':
             highlights.append({
                 'type': 'ai',
-                'position': calculate_position(text, idx, idx + chunk_size)
+                'position': calculate_position(text, start, end),
+                'start': start,
+                'end': end
             })
+    return scores, highlights
 
-    avg = round(sum(scores) / len(scores), 1) if scores else 0.0
-    # caping so that plagiarism + ai ≤ 100
-    cap = max(0.0, 100.0 - plagiarism_score)
-    return {
-        'score': min(avg, cap),
-        'highlights': highlights
-    }
+
+def token_chunks(tokenizer, text):
+    """
+    (start, end) character ranges of the token windows scored by the detector.
+
+    Lines are packed into windows of up to AI_DETECTOR_MAX_LENGTH tokens
+    (minus special tokens); longer lines are split on their own. A window is
+    also closed after every line whose hash is divisible by
+    AI_CHUNK_ANCHOR_EVERY, so boundaries follow the content rather than the
+    position and an edit only changes the windows around it. Windows then
+    take AI_DETECTOR_STRIDE tokens of context from the previous one, and a
+    short last window is filled back up to full size.
+    """
+    offsets = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        verbose=False
+    )['offset_mapping']
+    n = len(offsets)
+    if not n:
+        return []
+    size = settings.AI_DETECTOR_MAX_LENGTH - tokenizer.num_special_tokens_to_add()
+    stride = min(settings.AI_DETECTOR_STRIDE, size - 1)
+    capacity = size - stride
+    every = settings.AI_CHUNK_ANCHOR_EVERY
+    breaks = [m.start() for m in re.finditer('\n', text)]
+
+    windows = []
+    open_at = None  # first token of the window being filled
+    i = 0
+    while i < n:
+        # tokens [i, j) make up one line
+        line = bisect.bisect_right(breaks, offsets[i][0])
+        line_end = breaks[line] if line < len(breaks) else len(text)
+        j = i + 1
+        while j < n and offsets[j][0] < line_end:
+            j += 1
+
+        if open_at is not None and j - open_at > capacity:
+            windows.append((open_at, i))
+            open_at = None
+        if open_at is None:
+            open_at = i
+        while j - open_at > capacity:
+            windows.append((open_at, open_at + capacity))
+            open_at += capacity
+
+        line_text = text[offsets[i][0]:offsets[j - 1][1]]
+        if every and zlib.crc32(line_text.encode('utf-8')) % every == 0:
+            windows.append((open_at, j))
+            open_at = None
+        i = j
+    if open_at is not None:
+        windows.append((open_at, n))
+
+    if len(windows) > 1 and windows[-1][1] - windows[-1][0] < capacity // 4:
+        windows[-1] = (max(0, windows[-1][1] - capacity), windows[-1][1])
+    return [
+        (offsets[max(0, start - stride)][0], offsets[end - 1][1])
+        for start, end in windows
+    ]
 
 
 def calculate_position(full_text, start, end):
@@ -163,6 +612,7 @@ def calculate_document_stats(text):
     chars = len(text)
     pages = max(1, (chars // 1500) + 1)
     try:
+        import textstat
         read = textstat.reading_time(text, ms_per_char=14.69)
     except Exception:
         read = max(1, words // 200)
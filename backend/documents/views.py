@@ -2,33 +2,49 @@ from rest_framework.views import APIView
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 
-from .models import Document
-from .serializers import DocumentSerializer
+from .models import AnalysisJob, Document
+from .pagination import DocumentCursorPagination
+from .serializers import DocumentContentSerializer, DocumentListSerializer, DocumentSerializer
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
 
 from .utils import (
     extract_text_from_file,
-    analyze_text,
-    check_ai_probability,
     calculate_document_stats
 )
 
+from .analysis import (
+    AnalysisError,
+    cached_extraction,
+    calculate_content_hash,
+    calculate_file_hash,
+    corpus_changes,
+    find_parent,
+    read_uploads,
+    redetect,
+    remember_extraction,
+    run_analysis,
+    run_batch_analysis,
+    scan_mode
+)
+
+from django.conf import settings
+from django.db import connection
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-import hashlib
-import re
+import json
 import logging
+import os
+import queue
+import threading
 
 logger = logging.getLogger(__name__)
 
-def calculate_content_hash(text):
-    return hashlib.md5(text.encode('utf-8')).hexdigest()
-
-
 @method_decorator(csrf_exempt, name='dispatch')
 class AnalyzeDocumentView(APIView):
     authentication_classes = [JWTAuthentication]
@@ -45,93 +61,203 @@ class AnalyzeDocumentView(APIView):
             if file.size > 10 * 1024 * 1024:
                 return Response({"error": "File too large (max 10MB)"}, status=400)
 
-            # 3. extract & basic validation
-            text = extract_text_from_file(file).strip()
-            logger.info(f"[{request.user}] extracted {len(text)} chars")
+            # 3. extract, score & persist
+            result = run_analysis(
+                request.user, file,
+                parent=request.data.get('parent'),
+                ai_scan=request.data.get('ai_scan')
+            )
+            return Response(result, status=200)
+
+        except (ValidationError, AnalysisError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception("AnalyzeDocumentView error")
+            return Response({"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AnalyzeBatchView(APIView):
+    """
+    Several documents in one call: `documents` (repeatable) holds PDF, DOCX
+    or TXT files and/or .zip archives of them. Responds with one entry per
+    document (the AnalyzeDocumentView payload plus its name, or its name and
+    an error) and the pairwise similarity matrix of the analyzed ones.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
 
-            words = re.findall(r'\w+', text)
-            if len(words) < 10 or len(text) < 200:
-                return Response({"error": "Document too short for analysis"}, status=400)
+    def post(self, request):
+        try:
+            files = request.FILES.getlist('documents')
+            if not files:
+                return Response({"error": "No documents provided"}, status=400)
 
-            # 4. dedupe by hash
-            content_hash = calculate_content_hash(text)
-            existing = Document.objects.filter(content_hash=content_hash).first()
+            items = read_uploads(files)
+            if not items:
+                return Response({"error": "No supported documents found"}, status=400)
 
-            # 5. plagiarism & AI
-            plag = analyze_text(content_hash, text)
-            p_score = min(plag['score'], 100.0)
+            result = run_batch_analysis(request.user, items, ai_scan=request.data.get('ai_scan'))
+            return Response(result, status=200)
 
-            ai = check_ai_probability(text, plag['highlights'], plagiarism_score=p_score)
-            ai_score = min(ai['score'], 100.0 - p_score)
+        except (ValidationError, AnalysisError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception("AnalyzeBatchView error")
+            return Response({"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            # 6. original
-            orig = round(max(0.0, 100.0 - (p_score + ai_score)), 1)
 
-            p_score = round(p_score, 1)
-            ai_score = round(ai_score, 1)
+@method_decorator(csrf_exempt, name='dispatch')
+class AnalyzeDocumentStreamView(APIView):
+    """
+    Same analysis as AnalyzeDocumentView streamed as server-sent events: one
+    event per finished stage or batch (extraction, candidates, plagiarism,
+    ai) with partial scores and new highlights, then `result` carrying the
+    usual payload, or `error`.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
 
-            # 7. persist
-            stats = calculate_document_stats(text)
-            highlights = plag['highlights'] + ai['highlights']
+    def post(self, request):
+        if 'document' not in request.FILES:
+            return Response({"error": "No document provided"}, status=400)
 
-            if existing:
-                existing.plagiarism_score = p_score
-                existing.ai_score = ai_score
-                existing._highlights = highlights
-                existing.word_count = stats['word_count']
-                existing.character_count = stats['character_count']
-                existing.page_count = stats['page_count']
-                existing.reading_time = stats['reading_time']
-                existing.save()
-                doc = existing
-            else:
-                doc = Document.objects.create(
-                    user=request.user,
-                    content=text,
-                    content_hash=content_hash,
-                    plagiarism_score=p_score,
-                    ai_score=ai_score,
-                    _highlights=highlights,
-                    file=file,
-                    **stats
+        file = request.FILES['document']
+        if file.size > 10 * 1024 * 1024:
+            return Response({"error": "File too large (max 10MB)"}, status=400)
+
+        events = queue.Queue()
+        user = request.user
+        parent = request.data.get('parent')
+        ai_scan = request.data.get('ai_scan')
+
+        def run():
+            try:
+                result = run_analysis(
+                    user, file,
+                    progress=lambda event, data: events.put((event, data)),
+                    parent=parent,
+                    ai_scan=ai_scan
                 )
+                events.put(('result', result))
+            except (ValidationError, AnalysisError) as e:
+                events.put(('error', {"error": str(e)}))
+            except Exception:
+                logger.exception("AnalyzeDocumentStreamView error")
+                events.put(('error', {"error": "Internal server error"}))
+            finally:
+                connection.close()
 
-            # 8. response (exact same shape you had)
-            result = {
-                'id': doc.id,
-                'fileUrl': doc.file.url,
-                'plagiarismScore': p_score,
-                'aiScore': ai_score,
-                'originalScore': orig,
-                'documentStats': {
-                    'wordCount': doc.word_count,
-                    'characterCount': doc.character_count,
-                    'pageCount': doc.page_count,
-                    'readingTime': doc.reading_time
-                },
-                'highlights': doc.highlights
-            }
-            return Response(result, status=200)
+        threading.Thread(target=run, daemon=True).start()
+
+        def stream():
+            while True:
+                try:
+                    event, data = events.get(timeout=15)
+                except queue.Empty:
+                    # comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event in ('result', 'error'):
+                    return
 
-        except ValidationError as e:
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AnalysisJobView(APIView):
+    """Queue an analysis (202 + job id) instead of running it inside the request."""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if 'document' not in request.FILES:
+            return Response({"error": "No document provided"}, status=400)
+
+        file = request.FILES['document']
+        if file.size > 10 * 1024 * 1024:
+            return Response({"error": "File too large (max 10MB)"}, status=400)
+
+        try:
+            parent = find_parent(request.user, None, request.data.get('parent'))
+            ai_scan = scan_mode(request.data.get('ai_scan'))
+        except AnalysisError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            logger.exception("AnalyzeDocumentView error")
-            return Response({"error": "Internal server error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        job = AnalysisJob.objects.create(
+            user=request.user, file=file, original_name=os.path.basename(file.name),
+            parent=parent, ai_scan=ai_scan
+        )
+        return Response({
+            'jobId': job.id,
+            'status': job.status,
+            'statusUrl': reverse('analysis-job-detail', args=[job.id], request=request)
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AnalysisJobDetailView(APIView):
+    """Status of a queued analysis; `result` has the same shape as AnalyzeDocumentView's response."""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        job = AnalysisJob.objects.filter(pk=pk, user=request.user).first()
+        if job is None:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        payload = {'jobId': job.id, 'status': job.status}
+        if job.status == AnalysisJob.DONE:
+            payload['result'] = job.result
+        elif job.status == AnalysisJob.FAILED:
+            payload['error'] = job.error
+        return Response(payload, status=200)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
 class DocumentViewSet(viewsets.ModelViewSet):
-    queryset = Document.objects.all()
+    """
+    The user's documents, without their text: pass `?include_content=true`
+    or use the `content` action to get it.
+    """
     serializer_class = DocumentSerializer
+    pagination_class = DocumentCursorPagination
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def include_content(self):
+        return self.request.query_params.get('include_content', '').lower() in ('1', 'true')
+
+    def get_queryset(self):
+        queryset = Document.objects.filter(user=self.request.user)
+        if self.action in ('list', 'retrieve') and self.include_content():
+            # the text lives in DocumentText; fetch it in the same query
+            queryset = queryset.select_related('stored_text')
+        elif self.action == 'list':
+            queryset = queryset.defer('_highlights')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.include_content():
+            return DocumentContentSerializer
+        if self.action == 'list':
+            return DocumentListSerializer
+        return DocumentSerializer
+
     def perform_create(self, serializer):
         file = self.request.FILES.get('file')
         if file:
-            text = extract_text_from_file(file)
-            content_hash = calculate_content_hash(text)
+            file_hash = calculate_file_hash(file)
+            cached = cached_extraction(file_hash)
+            if cached:
+                text, content_hash = cached.content, cached.content_hash
+            else:
+                text = extract_text_from_file(file)
+                content_hash = calculate_content_hash(text)
 
             existing = Document.objects.filter(
                 user=self.request.user,
@@ -139,23 +265,41 @@ class DocumentViewSet(viewsets.ModelViewSet):
             ).first()
 
             if existing:
+                # results refer to the stored text, however this upload's differs
+                text = existing.content
+                remember_extraction(file_hash, existing)
+                version, added = corpus_changes(existing)
+                if added == []:
+                    # nothing added or deleted since the last analysis
+                    return
                 # update scores if re-uploaded
-                plag = analyze_text(content_hash, text)
-                ai = check_ai_probability(text, plag['highlights'], plagiarism_score=plag['score'])
+                plag, ai = redetect(self.request.user, existing, content_hash, text, added)
                 existing.plagiarism_score = plag['score']
                 existing.ai_score = ai['score']
+                existing.ai_raw_score = ai['raw_score']
+                existing.ai_confidence = ai['confidence']
                 existing._highlights = plag['highlights'] + ai['highlights']
+                existing.analysis_version = version
+                existing.analysis_mode = settings.PLAGIARISM_MODE
                 existing.save()
                 return
 
             stats = calculate_document_stats(text)
-            serializer.save(
+            doc = serializer.save(
                 user=self.request.user,
                 content=text,
                 content_hash=content_hash,
+                file_hash=file_hash,
+                file_name=os.path.basename(file.name),
                 _highlights=[],
                 **stats
             )
+            remember_extraction(file_hash, doc)
+
+    @action(detail=True, methods=['get'])
+    def content(self, request, pk=None):
+        document = self.get_object()
+        return Response({'id': document.id, 'content': document.content})
 
     @action(detail=False, methods=['get'], url_path='test-csrf')
     def test_csrf(self, request):
@@ -0,0 +1,119 @@
+# documents/winnowing.py
+"""
+Winnowing (Schleimer, Wilkerson & Aiken, 2003): hash every k-gram of the
+normalized text and keep only the minimum hash of each window of w
+consecutive k-grams. Any shared passage of at least t = w + k - 1
+normalized characters is guaranteed to share a fingerprint, while
+matches shorter than k are ignored as noise.
+"""
+from collections import deque
+
+from django.conf import settings
+
+from .models import Document, Fingerprint
+from .normalize import canonical_text
+from .shingles import alnum_chars
+from .texts import QUERY_BATCH
+
+# Karp-Rabin rolling hash modulo a Mersenne prime; values fit a BigIntegerField
+_BASE = 257
+_MOD = (1 << 61) - 1
+
+
+def kgram_hashes(text, k):
+    """Rolling hashes of every k-gram of an already normalized string."""
+    if len(text) < k:
+        return []
+    top = pow(_BASE, k - 1, _MOD)
+    h = 0
+    for ch in text[:k]:
+        h = (h * _BASE + ord(ch)) % _MOD
+    hashes = [h]
+    for i in range(k, len(text)):
+        h = ((h - ord(text[i - k]) * top) * _BASE + ord(text[i])) % _MOD
+        hashes.append(h)
+    return hashes
+
+
+def winnow(hashes, w):
+    """
+    (hash, index) of the rightmost minimum of each window of w hashes,
+    recorded once per change of selection.
+    """
+    if not hashes:
+        return []
+    w = max(1, min(w, len(hashes)))
+    window = deque()
+    selected = []
+    for i, h in enumerate(hashes):
+        while window and hashes[window[-1]] >= h:
+            window.pop()
+        window.append(i)
+        if window[0] <= i - w:
+            window.popleft()
+        if i >= w - 1 and (not selected or selected[-1][1] != window[0]):
+            selected.append((hashes[window[0]], window[0]))
+    return selected
+
+
+def fingerprints(text):
+    """
+    Winnowed fingerprints of text as (hash, start, end), with start/end
+    offsets into the original (un-normalized) text.
+    """
+    k = settings.WINNOWING_NOISE_THRESHOLD
+    w = settings.WINNOWING_GUARANTEE_THRESHOLD - k + 1
+    norm, offsets = alnum_chars(text)
+    return [
+        (h, offsets[i], offsets[i + k - 1] + 1)
+        for h, i in winnow(kgram_hashes(norm, k), w)
+    ]
+
+
+def index_fingerprints(document):
+    """(Re)build the stored fingerprints of a single document."""
+    Fingerprint.objects.filter(document=document).delete()
+    hashes = {h for h, _, _ in fingerprints(canonical_text(document.content)[0])}
+    Fingerprint.objects.bulk_create(
+        (Fingerprint(hash=h, document=document) for h in hashes),
+        batch_size=5000,
+        ignore_conflicts=True
+    )
+
+
+def matched_spans(text, exclude_hash=None, documents=None, exclude_ids=()):
+    """
+    (start, end) spans of text covered by fingerprints found in another
+    document (among the ids in documents, if given, and not in exclude_ids).
+    """
+    fps = fingerprints(text)
+    excluded = set(exclude_ids)
+    if exclude_hash:
+        excluded.update(
+            Document.objects.filter(content_hash=exclude_hash).values_list('pk', flat=True)
+        )
+
+    hashes = list({h for h, _, _ in fps})
+    found = set()
+    for i in range(0, len(hashes), QUERY_BATCH):
+        rows = (
+            Fingerprint.objects
+            .filter(hash__in=hashes[i:i + QUERY_BATCH])
+            .exclude(document_id__in=excluded)
+        )
+        if documents is not None:
+            rows = rows.filter(document_id__in=documents)
+        found.update(rows.values_list('hash', flat=True))
+
+    # consecutive matched fingerprints are at most w k-grams apart, so a run
+    # of them covers one shared passage end to end
+    spans = []
+    prev_matched = False
+    for h, start, end in fps:
+        matched = h in found
+        if matched and prev_matched:
+            spans[-1] = (spans[-1][0], end)
+        elif matched:
+            spans.append((start, end))
+        prev_matched = matched
+    return spans
@@ -0,0 +1,28 @@
+"""
+Preload-then-fork serving:
+
+    gunicorn -c gunicorn.conf.py plagiarism_checker.wsgi
+
+The app is imported once in the master, which also loads and test-runs the
+AI detector (AI_DETECTOR_WARMUP), before the workers are forked. The model
+weights are memory-mapped from their safetensors file (AI_DETECTOR_MMAP)
+and only ever read, so every worker shares the master's pages instead of
+holding its own copy.
+"""
+import os
+
+# set before the app is preloaded, so DocumentsConfig.ready() loads the detector
+os.environ.setdefault('AI_DETECTOR_WARMUP', 'True')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+# an upload can take minutes on CPU
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 300))
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # workers open their own database connections
+    from django.db import connections
+    connections.close_all()
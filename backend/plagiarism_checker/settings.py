@@ -140,6 +140,9 @@ REST_FRAMEWORK = {
     ]
 }
 
+# documents per page of the /documents/ list (cursor paginated)
+DOCUMENTS_PAGE_SIZE = int(os.getenv('DOCUMENTS_PAGE_SIZE', 50))
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=120),  # Explicitly set token lifespan
@@ -150,6 +153,116 @@ CORS_ALLOW_ALL_ORIGINS = True  # Temporary for development
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Text extraction
+# pages of a PDF analyzed at most (0 = all)
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 500))
+# PDFs with at least this many pages are extracted by a process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 40))
+PDF_EXTRACTION_WORKERS = int(os.getenv('PDF_EXTRACTION_WORKERS', os.cpu_count() or 1))
+
+# Text normalization before hashing, indexing and detection: NFKC,
+# dehyphenation and whitespace collapsing always, case folding optionally
+TEXT_CASEFOLD = os.getenv('TEXT_CASEFOLD', 'False') == 'True'
+# drop page numbers and running headers/footers
+TEXT_STRIP_BOILERPLATE = os.getenv('TEXT_STRIP_BOILERPLATE', 'True') == 'True'
+# drop everything from a "References"/"Bibliography" heading in the second half on
+TEXT_STRIP_REFERENCES = os.getenv('TEXT_STRIP_REFERENCES', 'True') == 'True'
+
+# Plagiarism detection
+# 'alignment' (exact common substrings with the candidates), 'tfidf'
+# (TF-IDF over 200-char windows), 'winnowing' (fingerprint intersection) or
+# 'streaming' (hashed 200-char windows against the whole corpus, bounded memory)
+PLAGIARISM_MODE = os.getenv('PLAGIARISM_MODE', 'alignment')
+# tfidf mode: number of 200-char windows scored per sparse matrix multiply
+PLAGIARISM_WINDOW_BATCH = int(os.getenv('PLAGIARISM_WINDOW_BATCH', 256))
+# alignment: shortest reported match, in normalized (alphanumeric) characters
+ALIGNMENT_MIN_MATCH_LENGTH = int(os.getenv('ALIGNMENT_MIN_MATCH_LENGTH', 50))
+# winnowing: matches shorter than the noise threshold are ignored, shared
+# passages at least as long as the guarantee threshold are always found
+# (both in normalized characters)
+WINNOWING_NOISE_THRESHOLD = int(os.getenv('WINNOWING_NOISE_THRESHOLD', 25))
+WINNOWING_GUARANTEE_THRESHOLD = int(os.getenv('WINNOWING_GUARANTEE_THRESHOLD', 60))
+# streaming: corpus texts held at once are capped by the memory ceiling;
+# only the top-k sources (by matched windows) are kept
+PLAGIARISM_STREAM_MEMORY_MB = int(os.getenv('PLAGIARISM_STREAM_MEMORY_MB', 256))
+PLAGIARISM_STREAM_CHUNK_SIZE = int(os.getenv('PLAGIARISM_STREAM_CHUNK_SIZE', 100))
+PLAGIARISM_STREAM_TOP_K = int(os.getenv('PLAGIARISM_STREAM_TOP_K', 50))
+# candidate pre-filter for alignment/tfidf modes: 'ngram' (inverted 5-gram index) or
+# 'lsh' (MinHash + LSH banding); at most PLAGIARISM_MAX_CANDIDATES are compared
+PLAGIARISM_CANDIDATES = os.getenv('PLAGIARISM_CANDIDATES', 'ngram')
+PLAGIARISM_MAX_CANDIDATES = int(os.getenv('PLAGIARISM_MAX_CANDIDATES', 50))
+# only documents sharing this many hashed 5-grams with an upload are compared
+PLAGIARISM_MIN_SHARED_NGRAMS = int(os.getenv('PLAGIARISM_MIN_SHARED_NGRAMS', 20))
+# MinHash/LSH: MINHASH_PERMUTATIONS must be a multiple of LSH_BANDS; fewer
+# rows per band catch lower similarities. Candidates below LSH_THRESHOLD
+# estimated Jaccard similarity are dropped.
+MINHASH_PERMUTATIONS = int(os.getenv('MINHASH_PERMUTATIONS', 128))
+MINHASH_SHINGLE_SIZE = int(os.getenv('MINHASH_SHINGLE_SIZE', 9))
+LSH_BANDS = int(os.getenv('LSH_BANDS', 64))
+LSH_THRESHOLD = float(os.getenv('LSH_THRESHOLD', 0.02))
+
+# AI detection
+AI_DETECTOR_MODEL = os.getenv('AI_DETECTOR_MODEL', 'Hello-SimpleAI/chatgpt-detector-roberta')
+# 'torch' (transformers pipeline) or 'onnx' (ONNX Runtime, CPU); the ONNX
+# export is written to AI_ONNX_DIR on first use or by `export_onnx_detector`
+AI_DETECTOR_BACKEND = os.getenv('AI_DETECTOR_BACKEND', 'torch')
+# torch backend: memory-map the safetensors weights (shared by forked workers)
+AI_DETECTOR_MMAP = os.getenv('AI_DETECTOR_MMAP', 'True') == 'True'
+AI_ONNX_DIR = os.getenv('AI_ONNX_DIR', os.path.join(BASE_DIR, 'onnx_models'))
+AI_ONNX_QUANTIZE = os.getenv('AI_ONNX_QUANTIZE', 'True') == 'True'
+# ONNX Runtime intra-op threads; 0 lets it pick
+AI_ONNX_THREADS = int(os.getenv('AI_ONNX_THREADS', 0))
+# load and test-run the detector when Django starts (set it for serving
+# processes only; `manage.py warmup_detector` does the same on demand)
+AI_DETECTOR_WARMUP = os.getenv('AI_DETECTOR_WARMUP', 'False') == 'True'
+# shared inference server (`run_inference_server`), e.g. http://127.0.0.1:8765;
+# empty loads the detector in every worker. On timeout or connection errors
+# the worker falls back to its own detector unless the fallback is disabled.
+AI_INFERENCE_SERVER_URL = os.getenv('AI_INFERENCE_SERVER_URL', '')
+AI_INFERENCE_SERVER_TIMEOUT = float(os.getenv('AI_INFERENCE_SERVER_TIMEOUT', 60))
+AI_INFERENCE_SERVER_FALLBACK = os.getenv('AI_INFERENCE_SERVER_FALLBACK', 'True') == 'True'
+# server side dynamic batching: texts per batch and how long to wait for more
+AI_INFERENCE_MAX_BATCH = int(os.getenv('AI_INFERENCE_MAX_BATCH', 64))
+AI_INFERENCE_MAX_WAIT_MS = int(os.getenv('AI_INFERENCE_MAX_WAIT_MS', 10))
+# chunks per forward pass of the detector pipeline
+AI_DETECTOR_BATCH_SIZE = int(os.getenv('AI_DETECTOR_BATCH_SIZE', 8))
+# model input size in tokens; texts are cut into windows of this size
+AI_DETECTOR_MAX_LENGTH = int(os.getenv('AI_DETECTOR_MAX_LENGTH', 512))
+# overlap, in tokens, between consecutive windows
+AI_DETECTOR_STRIDE = int(os.getenv('AI_DETECTOR_STRIDE', 0))
+# close a window after roughly one line in this many (chosen by content hash)
+# so edits only shift nearby chunks; 0 packs lines greedily
+AI_CHUNK_ANCHOR_EVERY = int(os.getenv('AI_CHUNK_ANCHOR_EVERY', 32))
+# per-chunk prediction cache size (least recently used entries are evicted)
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', 200000))
+# 'adaptive' scores a stratified sample of chunks until the 95% interval of
+# the document score is at most AI_SAMPLING_TOLERANCE points wide (after at
+# least MIN and at most MAX chunks, 0 for no cap); 'full' scores every chunk.
+# Requests can ask for either with `ai_scan`
+AI_SCAN_MODE = os.getenv('AI_SCAN_MODE', 'adaptive')
+AI_SAMPLING_TOLERANCE = float(os.getenv('AI_SAMPLING_TOLERANCE', 10))
+AI_SAMPLING_MIN_CHUNKS = int(os.getenv('AI_SAMPLING_MIN_CHUNKS', 16))
+AI_SAMPLING_MAX_CHUNKS = int(os.getenv('AI_SAMPLING_MAX_CHUNKS', 64))
+
+# run plagiarism and AI detection of one upload in parallel threads
+ANALYSIS_PARALLEL_DETECTORS = os.getenv('ANALYSIS_PARALLEL_DETECTORS', 'True') == 'True'
+
+# Revised drafts: an upload named like one of the user's documents (or given
+# an explicit `parent`) reuses its results and only re-analyzes the changes,
+# unless more than this fraction of the text changed
+ANALYSIS_REVISIONS = os.getenv('ANALYSIS_REVISIONS', 'True') == 'True'
+ANALYSIS_REVISION_MAX_CHANGE = float(os.getenv('ANALYSIS_REVISION_MAX_CHANGE', 0.5))
+
+# Analysis jobs (`run_analysis_worker`)
+ANALYSIS_WORKER_POLL_SECONDS = float(os.getenv('ANALYSIS_WORKER_POLL_SECONDS', 1))
+# running jobs older than this are assumed orphaned and queued again
+ANALYSIS_JOB_STALE_SECONDS = int(os.getenv('ANALYSIS_JOB_STALE_SECONDS', 3600))
+
+# Batch analysis (`analyze/batch/`)
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 20))
+# processes extracting text from the uploads in parallel
+BATCH_EXTRACTION_WORKERS = int(os.getenv('BATCH_EXTRACTION_WORKERS', os.cpu_count() or 1))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/